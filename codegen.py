@@ -0,0 +1,470 @@
+#!/tools/net/bin/python
+
+# Copyright (c) 1994, 1996, Tony J. Ibbs All rights reserved.
+# Copyright (c) 2004, Derek Chen-Becker All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#       
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#       
+#     * Neither the name of py-iso8211 nor the names of its contributors
+#       may be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""ISO 8211 decoders - Python source generated from a DDR.
+
+Splitting a field with "Field.split()" means interpreting its format
+controls and labels each time. Since the DDR says exactly how each field
+is laid out, we can instead write (and compile) a Python function for
+each tag, with the labels, offsets and so on written into it, which
+just does what is needed for that field.
+
+For instance:
+
+	import iso8211, codegen
+
+	ddf = iso8211.DDF()
+	ddf.open("file.000")
+
+	decoders = codegen.decoders(ddf)
+
+	for record in ddf:
+		for field in record:
+			subfields = decoders[field.tag](field.data[:-1])
+
+Each decoder takes the field's data (without the final FT), and returns
+the same list of (subfield label, subfield control, subfield data) tuples
+as "Field.split()" does (including interning the values of any subfields
+named in "DDF.intern_values()"). Where the generated code cannot handle a
+field (for instance, because the data is not exactly one repeat of the
+format controls) it simply calls "Field_desc.split()" instead.
+
+Use "generate_source()" to see the source that is generated.
+"""
+
+import os
+import re
+import imp
+import string
+import marshal
+
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import new as md5
+
+from misc import *
+
+
+# The version of the generated code - change this whenever the source
+# that is generated changes, so that old cached bytecode is not used
+
+CODEGEN_VERSION = "3"
+
+# Fixed width and delimited fields with more subfields than this are
+# left to "Field_desc.split()", rather than making enormous functions
+
+MAX_SUBFIELDS = 256
+
+
+# ----------------------------------------------------------------------
+def decoders(source,cache_dir=None):
+	"""Return a dictionary of {field tag :: decoder function} for SOURCE.
+
+	SOURCE is a DDR, or a DDF that has been opened (whose DDR is used).
+
+	If CACHE_DIR is given, the compiled code is kept in that directory,
+	in a file named after "ddr_key()", and is reused when a DDR with the
+	same key is met again (so the source need not be generated and
+	compiled each time the same kind of file is read).
+	"""
+
+	ddr  = _find_ddr(source)
+	key  = ddr_key(ddr)
+	code = None
+
+	if cache_dir != None:
+		path = os.path.join(cache_dir,"iso8211_decoders_%s.pyc"%key)
+		code = _read_cached(path)
+
+	if code == None:
+		code = compile(generate_source(ddr),"<iso8211 decoders %s>"%key,"exec")
+
+		if cache_dir != None:
+			_write_cached(path,code)
+
+	namespace = _namespace(ddr)
+
+	exec code in namespace
+
+	return namespace["decoders"]
+
+
+def ddr_key(source):
+	"""Return a string identifying the layout described by SOURCE's DDR.
+
+	DDRs with the same key produce the same generated source.
+	"""
+
+	ddr  = _find_ddr(source)
+	hash = md5(CODEGEN_VERSION)
+
+	hash.update(ddr.leader.octets)
+
+	for tag in ddr.list:
+		hash.update(tag)
+		hash.update(ddr.dict[tag].octets)
+
+	return hash.hexdigest()
+
+
+def generate_source(source):
+	"""Return the Python source for the decoders for SOURCE's DDR.
+
+	The source expects to be run with the names set up by "decoders()"
+	(it is not a module that can be imported on its own).
+	"""
+
+	ddr   = _find_ddr(source)
+	lines = []
+	names = []
+
+	lines.append('"""Decoders for %s"""'%ddr.list)
+	lines.append('')
+
+	for index in range(len(ddr.list)):
+		tag  = ddr.list[index]
+		desc = ddr.dict[tag]
+
+		if desc.format_controls == None or desc.array_descriptor == None:
+			continue
+
+		if re.match("[A-Za-z0-9_]+$",tag):
+			name = "decode_%s"%tag
+		else:
+			name = "decode_%d"%index
+
+		if not _generate_fixed(lines,name,tag,desc) and \
+		   not _generate_delimited(lines,name,tag,desc):
+			_generate_other(lines,name,tag,desc)
+
+		names.append((tag,name))
+
+	lines.append('')
+	lines.append('decoders = {')
+
+	for tag,name in names:
+		lines.append('\t%s: %s,'%(`tag`,name))
+
+	lines.append('}')
+	lines.append('')
+
+	return string.join(lines,"\n")
+
+
+# ----------------------------------------------------------------------
+def _find_ddr(source):
+	"""Return the DDR for SOURCE (a DDR, or an open DDF)."""
+
+	if hasattr(source,"ddr"):
+		source = source.ddr
+
+	if source == None or not hasattr(source,"dict"):
+		raise iso8211_error,"There is no DDR to generate decoders from"
+
+	return source
+
+
+def _namespace(ddr):
+	"""Return the names used by the generated source for DDR."""
+
+	split = {}
+	descs = {}
+
+	for tag in ddr.list:
+		descs[tag] = ddr.dict[tag]
+		split[tag] = descs[tag].split
+
+	def controls(tag,count):
+		return tuple(ddr.dict[tag].format_controls.controls_for(count))
+
+	return {"_split"	: split,
+		"_descs"	: descs,
+		"_controls"	: controls,
+		"_split_at"	: string.split,
+		"_UT"		: UT}
+
+
+def _subfields(desc,count):
+	"""Return the (label,control index) pairs for the first COUNT controls.
+
+	Labelled "X" controls are left out, as "Field.split()" does, and
+	the list stops if we run out of labels.
+	"""
+
+	format = desc.format_controls
+	names  = desc.label_list(count)
+	result = []
+
+	if names == None:
+		for which in range(count):
+			result.append((None,which))
+
+		return result
+
+	label = 0
+
+	for which in range(count):
+		if format.control_at(which).control == "X":
+			continue
+
+		if label >= len(names):
+			break
+
+		result.append((names[label],which))
+		label = label + 1
+
+	return result
+
+
+def _header(lines,name,tag,desc,count):
+	"""Start the source of a decoder function."""
+
+	lines.append('')
+	lines.append('_c_%s = _controls(%s,%d)'%(name,`tag`,count))
+	lines.append('_d_%s = _descs[%s]'%(name,`tag`))
+	lines.append('')
+	lines.append('def %s(data):'%name)
+	lines.append('\t"""%s: %s"""'%(tag,
+					   string.replace(`desc.format_controls.octets`,'"','\\"')))
+	lines.append('')
+
+
+def _footer(lines,name):
+	"""End the source of a decoder function, which has made SUBFIELDS."""
+
+	lines.append('')
+	lines.append('\tif _d_%s._interning != None:'%name)
+	lines.append('\t\treturn _d_%s._interned(subfields)'%name)
+	lines.append('')
+	lines.append('\treturn subfields')
+	lines.append('')
+
+
+def _generate_fixed(lines,name,tag,desc):
+	"""Generate a decoder for a field of fixed width subfields, if we can.
+
+	The decoder handles data with exactly one repeat of the format controls
+	(that is, a "unit_count()" of 1, with nothing left over), which it
+	slices up directly - anything else (more units, or an incomplete one)
+	is left to "Field_desc.split()". Returns FALSE if the format is not
+	fixed.
+	"""
+
+	format = desc.format_controls
+
+	if not format.fixed or desc.array_descriptor.variable or \
+	   format.count > MAX_SUBFIELDS:
+		return FALSE
+
+	count  = format.count
+	length = format.head_size + format.repeat_size
+
+	offsets = []
+	offset  = 0
+
+	for which in range(count):
+		offsets.append(offset)
+		offset = offset + format.control_at(which).byte_width
+
+	_header(lines,name,tag,desc,count)
+
+	lines.append('\tif len(data) != %d:\t\t# not exactly one unit'%length)
+	lines.append('\t\treturn _split[%s](data)'%`tag`)
+	lines.append('')
+	lines.append('\tsubfields = [')
+
+	for label,which in _subfields(desc,count):
+		control = format.control_at(which)
+		start   = offsets[which]
+		item    = 'data[%d:%d]'%(start,start+control.byte_width)
+
+		# LSOF binary forms are returned in MSOF order (as "read_item" does)
+
+		if control.form == "B" and control.control[0] == "b":
+			item = item + '[::-1]'
+
+		lines.append('\t\t(%s, _c_%s[%d], %s),'%(`label`,name,which,item))
+
+	lines.append('\t]')
+
+	_footer(lines,name)
+
+	return TRUE
+
+
+def _generate_delimited(lines,name,tag,desc):
+	"""Generate a decoder for a field of UT delimited subfields, if we can.
+
+	The decoder handles data with a single repeat of the format controls,
+	which it splits at each UT. If the "A" subfields are in a multi-octet
+	character set when the decoder is called (see "Field_desc.wide_UT()"),
+	it is left to "Field_desc.split()". Returns FALSE if the format is not
+	one of character subfields delimited by UT.
+	"""
+
+	format = desc.format_controls
+
+	if not format.all_delimited or desc.array_descriptor.variable or \
+	   format.count > MAX_SUBFIELDS:
+		return FALSE
+
+	count = format.count
+
+	_header(lines,name,tag,desc,count)
+
+	for which in range(count):
+		if format.control_at(which).control == "A":
+			lines.append('\tif _d_%s.wide_UT() != None:'%name)
+			lines.append('\t\treturn _split[%s](data)'%`tag`)
+			lines.append('')
+			break
+
+	lines.append('\titems = _split_at(data,_UT)')
+	lines.append('')
+	lines.append('\tif data[-1:] == _UT:')
+	lines.append('\t\tdel items[-1]')
+	lines.append('')
+	lines.append('\tif len(items) != %d or data == "":'%count)
+	lines.append('\t\treturn _split[%s](data)'%`tag`)
+	lines.append('')
+	lines.append('\tsubfields = [')
+
+	for label,which in _subfields(desc,count):
+		lines.append('\t\t(%s, _c_%s[%d], items[%d]),'%(`label`,name,which,which))
+
+	lines.append('\t]')
+
+	_footer(lines,name)
+
+	return TRUE
+
+
+def _generate_other(lines,name,tag,desc):
+	"""Generate a decoder which just uses "Field_desc.split()"."""
+
+	lines.append('')
+	lines.append('def %s(data):'%name)
+	lines.append('\t"""%s: %s"""'%(tag,
+					   string.replace(`desc.format_controls.octets`,'"','\\"')))
+	lines.append('')
+	lines.append('\treturn _split[%s](data)'%`tag`)
+	lines.append('')
+
+
+def _read_cached(path):
+	"""Return the code object cached in PATH, or None if there isn't one."""
+
+	try:
+		file = open(path,"rb")
+		try:
+			octets = file.read()
+		finally:
+			file.close()
+	except IOError:
+		return None
+
+	if octets[:4] != imp.get_magic():
+		return None
+
+	try:
+		return marshal.loads(octets[4:])
+	except (ValueError,EOFError,TypeError):
+		return None
+
+
+def _write_cached(path,code):
+	"""Cache the code object CODE in PATH (quietly giving up if we can't)."""
+
+	temp = "%s.%d"%(path,os.getpid())
+
+	try:
+		file = open(temp,"wb")
+		try:
+			file.write(imp.get_magic())
+			file.write(marshal.dumps(code))
+		finally:
+			file.close()
+
+		os.rename(temp,path)
+	except (IOError,OSError):
+		pass
+
+
+# ----------------------------------------------------------------------
+def test():
+	"""Check the generated decoders against "Field_desc.split()".
+
+	Each field is tried with none, one and several repeats of its format
+	(and with an incomplete repeat), with and without interning.
+	"""
+
+	import field_desc
+
+	ddr = field_desc._Test_DDR()
+	ddr.leader.octets = "test"
+	ddr.list = []
+	ddr.dict = {}
+
+	fields = (("FIXD","1600;&","A!B","(A(2),I(3))",		"ab123"),
+		  ("UNIT","1600;&","","(A(1),(2I(2)))",		"x0102"),
+		  ("TABL","2600;&","*X!Y","(A(2),b12)",		"ab\x01\x02"),
+		  ("DELM","1600;&","P!Q","(A,I)",		"pq"+UT+"12"+UT))
+
+	for tag,field_controls,labels,formats,data in fields:
+		ddr.list.append(tag)
+		ddr.dict[tag] = field_desc._test_desc(tag,field_controls,labels,formats)
+
+	table = Intern_table(100)
+
+	for interning in (None,({"A":TRUE,"X":TRUE,"P":TRUE},table)):
+		decode = decoders(ddr)
+
+		for tag,field_controls,labels,formats,data in fields:
+			desc = ddr.dict[tag]
+			desc._interning = interning
+
+			for tries in ("",data,data*3,data+data[:2]):
+				wanted = desc.split(tries)
+				got    = decode[tag](tries)
+
+				if got != wanted:
+					raise AssertionError,"%s %s: got %s, wanted %s"%\
+					      (tag,`tries`,got,wanted)
+
+				if interning != None and len(wanted) > 0 and \
+				   got[0][2] is not desc.split(tries)[0][2]:
+					raise AssertionError,"%s %s: not interned"%(tag,`tries`)
+
+	print "codegen: OK"
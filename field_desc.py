@@ -40,11 +40,17 @@ import sys
 import os
 import array
 import string
+import re
+import codecs
 import Dates
 
 from   misc   import *
 import format
 
+# The format control used to read the dimensions of a variable array
+
+_var_array_control = format.Control("I",None,None)
+
 
 
 # ----------------------------------------------------------------------
@@ -103,6 +109,29 @@ class Field_desc:
 		self.array_descriptor = None
 		self.format_controls  = None
 
+		# Plans for splitting fixed width data, by data length,
+		# the compiled patterns for splitting delimited data,
+		# and where to find each labelled subfield
+
+		self._fixed_plans      = {}
+		self._delimited_plan   = None
+		self._delimited_tried  = FALSE
+		self._label_positions  = None
+
+		# The (codec name,decoder) for our character subfields, and
+		# whether they are delimited by a UT in a multi-octet character
+		# set (TRUE/FALSE, or None if we haven't looked yet), and if so
+		# the (codec name,UT,FT) for it
+
+		self._decoder     = None
+		self._delimited_A = None
+		self._wide        = None
+
+		# The ({label :: TRUE},Intern_table) for the subfield values
+		# to be interned, if any (see "DDF.intern_values()")
+
+		self._interning = None
+
 	def _process(self):
 		"""Called during initialisation to setup the rest of our contents."""
 
@@ -148,106 +177,1068 @@ class Field_desc:
 	def _read_field_name(self,octets):
 		"""Read the data field name."""
 
-		# At level 1, the data field name is all that is in the field
-		# description, so it is ended by FT. At other levels, it is
-		# ended by UT. So read these appropriately
+		# At level 1, the data field name is all that is in the field
+		# description, so it is ended by FT. At other levels, it is
+		# ended by UT. So read these appropriately
+
+		if self.level == 1:
+			self.data_field_name = read_to_FT(octets)
+		else:
+			# In 6.4.1, para 1, it says:
+			# "Missing elements of the data description shall be represented by
+			#  adjacent delimiters and a terminal string of adjacent delimiters
+			#  shall not be replaced by the field delimiter."
+			#        ^^^
+			# Some data written by the SDTS FIPS123 library (in particular) seems
+			# to disobey this - I need to check what the previous version of ISO 8211
+			# has to say, since that's what they've coded to...
+
+			# So how do we handle this?
+			# The two problems I've found are:
+			# 1) null array descriptor and format controls, so they omitted the UTs
+			# 2) terminating the data field name with an FT instead of a UT - it may
+			#    be that (1) is a special case of this
+
+			# So first, try to read up to a terminating FT
+			# (at worst, this should read to the end of the field description)
+
+			temp = read_to_FT(octets)
+
+			# Then try to do it correctly
+
+			try:
+				self.data_field_name = read_to_UT(octets)
+			except iso8211_syntax_error:
+				print "Warning: Data field name for `%s' was not terminated by UT\n" \
+				      "         Data read was: `%s'\n" \
+				      "         Assuming field name SHOULD be: `%s'"%\
+				      (self.tag,printable(octets),printable(temp))
+
+				self.data_field_name = temp
+
+			# If reading it to a UT or FT gives us a shorter result than
+			# just reading to a UT, then we have found error (2) - so complain
+			# and use the `correct' data
+
+			if len(temp) < len(self.data_field_name):
+				print "Warning: Data field name for `%s' was terminated by FT "\
+				      "(instead of UT)\n" \
+				      "         Data read was: `%s'\n" \
+				      "         Assuming field name SHOULD be: `%s'"%\
+				      (self.tag,printable(octets),printable(temp))
+
+				self.data_field_name = temp
+
+
+	def _read_for_levels_2_and_3(self,tag,octets):
+		"""Read the array descriptor and format controls.
+
+		These are only present for levels 2 and 3."""
+
+		# The array descriptor (if any) is up to the next UT
+		# (not forgetting to ignore the UT character that ended
+		# the data field name)
+
+		if len(octets) > 1:
+
+			array_desc = read_to_UT_or_FT(octets)
+
+			
+
+			try:
+				self.array_descriptor.parse(array_desc)
+			except iso8211_no_array_error:
+				# Give better data for this exception
+				# (the array descriptor can't see our octets)
+				raise iso8211_noarray_error,(self.tag,self.octets)
+
+			# And the format controls (if any) come after that
+			# (not forgetting to ignore the UT or FT character
+			# that ended the array descriptor)
+
+			octets = octets[len(array_desc)+1:]
+
+			# If the array descriptor was ended by the terminal FT,
+			# then we may indeed not have any format controls
+			# So check the length of the string we're left with...
+
+			if len(octets) > 0:
+				self.format_controls.parse_with_FT(octets)
+
+
+	def __repr__(self):
+		return "Field description for tag `"+self.tag+"'"
+
+
+	def label_list(self,count):
+		"""Return (up to) the first COUNT expanded labels for this field.
+
+		Returns None for an unlabelled field. Raises ValueError for a
+		variable array field (whose labels depend upon its data).
+		"""
+
+		labels = self.array_descriptor
+
+		if labels.unlabelled:
+			return None
+		else:
+			return labels.first(count)
+
+
+	def label_positions(self):
+		"""Return a dictionary saying where to find each labelled subfield.
+
+		The dictionary is keyed by expanded label, and each value is the
+		tuple:
+
+			(position,control index,offset)
+
+		where "position" is the index of the subfield in the list returned
+		by "Field.split()", "control index" is the index of its format
+		control (these differ if there are "X" controls), and "offset" is
+		where its data starts (only meaningful if the format is "fixed").
+
+		Only the first subfield with a given label is included (so a table
+		is only gone through once). The dictionary is empty for unlabelled
+		fields, and for variable arrays (whose labels depend upon the data).
+		It is worked out the first time it is asked for.
+		"""
+
+		if self._label_positions != None:
+			return self._label_positions
+
+		format    = self.format_controls
+		labels    = self.array_descriptor
+		positions = {}
+
+		if format != None and labels != None and format.count > 0 and \
+		   not labels.unlabelled and not labels.variable:
+
+			which  = 0
+			offset = 0
+
+			# If the part of the format that repeats is all "X" controls,
+			# we would skip them for ever, so there is a limit
+
+			most_skips = format.count + format.repeat_count
+
+			for position in range(len(labels.labels)):
+				label = labels.labels[position]
+
+				# "X" controls are not labelled, but do take up room
+
+				try:
+					control = format.control_at(which)
+					skips   = 0
+
+					while control.control == "X" and skips < most_skips:
+						offset  = offset + control.byte_width
+						which   = which + 1
+						skips   = skips + 1
+						control = format.control_at(which)
+				except IndexError:
+					break
+
+				if control.control == "X":
+					break
+
+				if not positions.has_key(label):
+					positions[label] = (position,which,offset)
+
+				offset = offset + control.byte_width
+				which  = which + 1
+
+		self._label_positions = positions
+
+		return positions
+
+
+	def find_subfield(self,data,label):
+		"""Return the data for the (first) subfield labelled LABEL.
+
+		DATA is the field's data, without the final FT. The data is
+		interned if the DDF has been asked to intern LABEL's values (see
+		"DDF.intern_values()"), just as "split()" would.
+
+		See "_find_subfield()" for the details.
+		"""
+
+		item = self._find_subfield(data,label)
+
+		if self._interning != None:
+			labels,table = self._interning
+
+			if labels.has_key(label):
+				item = table.intern(item)
+
+		return item
+
+
+	def _find_subfield(self,data,label):
+		"""Return the data for the (first) subfield labelled LABEL.
+
+		DATA is the field's data, without the final FT.
+
+		Only as much of DATA is looked at as is needed - if our format is
+		all fixed width, we go straight to the subfield, and if it is all
+		ended by UT, we just look for the right UT.
+
+		Returns the subfield data, exactly as it would appear in the list
+		returned by "Field.split()". Raises KeyError if there is no such
+		label, or if DATA ends before we get to it (or, for a fixed width
+		subfield, before we get to its end).
+		"""
+
+		try:
+			position,which,offset = self.label_positions()[label]
+		except KeyError:
+			raise KeyError,label
+
+		format = self.format_controls
+		ut     = self.wide_UT()
+
+		if format.fixed:
+			control = format.control_at(which)
+
+			# (a subfield cut short by the end of the data is not there)
+
+			if offset + control.byte_width > len(data):
+				raise KeyError,label
+
+			item = data[offset:offset+control.byte_width]
+
+			# LSOF binary forms are returned in MSOF order (as "read_item" does)
+
+			if control.form == "B" and control.control[0] == "b":
+				item = item[::-1]
+
+			return item
+
+		elif format.all_delimited and ut == None:
+			if data == "":
+				raise KeyError,label
+
+			start = 0
+			for count in xrange(position):
+				start = string.find(data,UT,start) + 1
+
+				if start == 0 or start >= len(data):
+					raise KeyError,label
+
+			end = string.find(data,UT,start)
+
+			if end < 0:
+				end = len(data)
+
+			return data[start:end]
+
+		# Otherwise, read subfields one at a time until we get there
+
+		if ut == None:
+			ut = UT
+		else:
+			data = self._strip_wide_FT(data)
+
+		bits  = None
+		count = 0
+
+		for control in format.walk_forever():
+			try:
+				item,data,bits = read_packed_item(data,control,bits,ut)
+			except (IndexError,ValueError):
+				break
+
+			if control.control == "X":
+				continue
+			elif count == position:
+				return item
+
+			count = count + 1
+
+		raise KeyError,label
+
+
+	def unit_count(self,data):
+		"""Return the number of repeats (units) of our format in DATA.
+
+		DATA is the field's data, without the final FT.
+
+		This is only possible if our format is all fixed width (see
+		"Format.fixed"), in which case the data is the subfields before
+		the repeat, followed by units of "repeat_size" octets each.
+		Returns None if our format is not fixed width, or if we are a
+		variable array (whose data starts with its dimensions, so the
+		units can't be found by position). Any incomplete unit at the end
+		of the data is not counted.
+		"""
+
+		format = self.format_controls
+		labels = self.array_descriptor
+
+		if format == None or not format.fixed or len(data) < format.head_size:
+			return None
+
+		if labels != None and labels.variable:
+			return None
+
+		return (len(data) - format.head_size) / format.repeat_size
+
+
+	def unit(self,data,which):
+		"""Return the subfields in unit WHICH of DATA.
+
+		DATA is the field's data, without the final FT. WHICH counts from
+		0, and may be negative (to count back from the last unit).
+
+		The unit is found by working out its offset, and only its own
+		subfields are unpacked. Returns a list of tuples, exactly as
+		"Field.split()" does for those subfields.
+
+		Raises ValueError if our format is not all fixed width (or we are
+		a variable array), and IndexError if there is no such unit.
+		"""
+
+		count = self.unit_count(data)
+
+		if count == None:
+			raise ValueError,"Field `%s' does not have fixed width units"%self.tag
+
+		if which < 0:
+			which = which + count
+
+		if which < 0 or which >= count:
+			raise IndexError,"Unit should be 0 through %d, not %d"%(count-1,which)
+
+		format            = self.format_controls
+		unpacker,controls = format.unit_struct()
+
+		items = unpacker.unpack_from(data,format.head_size + which * format.repeat_size)
+
+		labels = self.array_descriptor
+		result = []
+
+		if labels == None or labels.unlabelled:
+			for index in range(len(controls)):
+				result.append((None,controls[index],items[index]))
+
+			return self._interned(self._lsof_to_msof(result))
+
+		# "X" controls are not labelled, so work out which label
+		# comes first in this unit
+
+		head_X = 0
+		for control in format.walk(format.head_runs):
+			if control.control == "X":
+				head_X = head_X + 1
+
+		unit_X = 0
+		for control in controls:
+			if control.control == "X":
+				unit_X = unit_X + 1
+
+		label = (format.repeat_from - head_X) + which * (len(controls) - unit_X)
+
+		for index in range(len(controls)):
+			control = controls[index]
+
+			if control.control == "X":
+				continue
+
+			try:
+				name = labels.item(label)
+			except IndexError:
+				break
+
+			result.append((name,control,items[index]))
+			label = label + 1
+
+		return self._interned(self._lsof_to_msof(result))
+
+
+	def _lsof_to_msof(self,subfields):
+		"""Put LSOF binary subfields into MSOF order (as "read_item" does)."""
+
+		for index in range(len(subfields)):
+			name,control,item = subfields[index]
+
+			if control.form == "B" and control.control[0] == "b":
+				subfields[index] = (name,control,item[::-1])
+
+		return subfields
+
+
+	def split(self,data):
+		"""Split DATA into subfields, according to this field description.
+
+		DATA is the field's data, without the final FT.
+
+		This does the work for "Field.split()" (qv), and returns a list of
+		(subfield label, subfield control, subfield data) tuples, just as
+		it does - but since it only needs the data, it can be used without
+		making a Field object at all.
+
+		If the DDF has been asked to intern the values of some of our
+		subfields (see "DDF.intern_values()"), then that is done as well.
+
+		Raises iso8211_error if there are no format controls or labels.
+		"""
+
+		return self._interned(self._split(data))
+
+
+	def _interned(self,subfields):
+		"""Return SUBFIELDS (a list of tuples, as from "split()"), interned.
+
+		If the DDF has been asked to intern the values of some of our
+		subfields, a new list is returned with those values interned.
+		Otherwise, SUBFIELDS is returned as it is.
+		"""
+
+		if self._interning == None:
+			return subfields
+
+		labels,table = self._interning
+		result       = []
+
+		for label,control,item in subfields:
+			if labels.has_key(label):
+				item = table.intern(item)
+
+			result.append((label,control,item))
+
+		return result
+
+
+	def _split(self,data):
+		"""Split DATA into subfields (see "split()"), without interning."""
+
+		if self.format_controls == None or self.array_descriptor == None:
+			raise iso8211_error, \
+			      "Unable to split data for field %s - no format controls or labels"%\
+			      self.tag
+
+		# If all the subfields are of fixed width, we can do the lot at once
+
+		list = self.split_fixed(data)
+
+		if list != None:
+			return list
+
+		# Character subfields in a multi-octet character set are ended
+		# by a UT in that character set, so we must read them one by one
+
+		ut = self.wide_UT()
+
+		if ut != None:
+			data = self._strip_wide_FT(data)
+
+			if self.array_descriptor.unlabelled:
+				return self._split_unlabelled(data,ut)
+			else:
+				return self._split_labelled(data,ut)
+
+		# Or if they're all ended by UT, by splitting at each UT
+
+		list = self.split_all_delimited(data)
+
+		if list != None:
+			return list
+
+		# Or if they're all character subfields, with a regular expression
+
+		list = self.split_delimited(data)
+
+		if list != None:
+			return list
+
+		# Otherwise, process it
+		# (a field that is just a repeated bit field, as in bit-packed
+		#  raster data, can be unpacked all in one go)
+
+		format = self.format_controls
+		labels = self.array_descriptor
+
+		if format.count == 1 and is_bit_field(format.control_at(0)) and \
+		   not labels.variable:
+			list = self._split_bit_fields(data,format.control_at(0))
+		elif labels.unlabelled:
+			list = self._split_unlabelled(data)
+		else:
+			list = self._split_labelled(data)
+
+		return list
+
+
+	def charset(self):
+		"""Return the name of the codec for our character subfields, or None.
+
+		This is the DDF's "charset", if that has been set. Otherwise it is
+		given by the truncated escape sequence in our field controls, or,
+		if we don't have one, by the extended character set in the DDR's
+		leader. None is returned if neither of those gives a character set
+		that we know (see "iso2022_codec()").
+		"""
+
+		ddf = self.ddr.ddf
+
+		if ddf != None and ddf.charset != None:
+			return ddf.charset
+
+		if self.field_controls != None:
+			codec = iso2022_codec(self.field_controls.truncated_esc_sequence)
+			if codec != None:
+				return codec
+
+		return iso2022_codec(self.ddr.leader.extended_character_set)
+
+
+	def wide_UT(self):
+		"""Return the UT that ends our character subfields, if it is not the usual one.
+
+		If our format has delimited "A" subfields, and "charset()" is a
+		multi-octet character set (such as UCS-2), then those subfields are
+		ended by a UT in that character set (for instance "\x00\x1f"), and
+		that is returned. Otherwise None is returned, and all our delimited
+		subfields are ended by the single octet UT.
+		"""
+
+		if self._delimited_A == None:
+			self._delimited_A = FALSE
+
+			if self.format_controls != None:
+				for controls,times in self.format_controls.runs:
+					for control in controls:
+						if control.control == "A" and control.form == None:
+							self._delimited_A = TRUE
+
+		if not self._delimited_A:
+			return None
+
+		codec = self.charset()
+
+		if codec == None:
+			return None
+
+		if self._wide == None or self._wide[0] != codec:
+			encoder = codecs.getencoder(codec)
+
+			# (encoding two of them means we can ignore any byte order mark)
+
+			width = len(encoder(u"\x1f\x1f")[0]) - len(encoder(u"\x1f")[0])
+
+			if width > 1:
+				self._wide = (codec,encoder(u"\x1f")[0][-width:],
+						    encoder(u"\x1e")[0][-width:])
+			else:
+				self._wide = (codec,None,None)
+
+		return self._wide[1]
+
+
+	def _strip_wide_FT(self,data):
+		"""Return DATA without what is left of a multi-octet FT at its end.
+
+		Only the final FT octet is taken off a field's data before it is
+		split, so when "wide_UT()" is not None the rest of the field's FT
+		(for instance, the "\x00" of UCS-2's "\x00\x1e") may still be there.
+		"""
+
+		ft = self._wide[2]
+
+		if data[-len(ft):] == ft:
+			return data[:-len(ft)]
+		elif ft[-1] == FT and data[-(len(ft)-1):] == ft[:-1]:
+			return data[:-(len(ft)-1)]
+		else:
+			return data
+
+
+	def decode(self,subfields):
+		"""Return SUBFIELDS (as returned by "split()") with the character data decoded.
+
+		The data for each subfield with an "A" control is decoded to a
+		Unicode string, using the codec given by "charset()" - the decoder
+		is only looked up when the codec changes, rather than for each field.
+		If there is no codec, SUBFIELDS is returned as it is.
+
+		Raises UnicodeError if the data is not valid for the codec.
+		"""
+
+		codec = self.charset()
+
+		if codec == None:
+			return subfields
+
+		if self._decoder == None or self._decoder[0] != codec:
+			self._decoder = (codec,codecs.getdecoder(codec))
+
+		decoder = self._decoder[1]
+		result  = []
+
+		for label,control,item in subfields:
+			if control.control == "A":
+				item = decoder(item)[0]
+
+			result.append((label,control,item))
+
+		return result
+
+
+	def _split_bit_fields(self,data,control):
+		"""Split a field whose format is a single, repeated, bit field.
+
+		Returns a list of tuples, as for "split()".
+		"""
+
+		values = unpack_bits(data,control.size)
+		names  = self.label_list(len(values))
+
+		if names == None:
+			names = [None] * len(values)
+
+		result = []
+		for index in range(len(names)):
+			result.append((names[index],control,values[index]))
+
+		return result
+
+
+
+	def _split_unlabelled(self,data,ut=UT):
+		"""Split DATA (for an unlabelled field) into subfields.
+
+		UT is the unit terminator for delimited "A" subfields (see "wide_UT()").
+
+		Returns a list of tuples:
+
+			(None, subfield control, subfield data)
+
+		where:
+			"subfield control"	is None or a Control object, containing the
+						format control for this subfield.
+			"subfield data"		is a string containing the data for this
+						subfield.
+
+		Note that "X" controls are not labelled, and do not contribute to the
+		list, although they do cause data to be skipped.
+		"""
+
+		list = []
+		bits = None		# not in a run of bit fields
+
+		for control in self.format_controls.walk_forever():
+			#print "Format %s"%(control)
+
+			try:
+				item,data,bits = read_packed_item(data,control,bits,ut)
+			except IndexError:
+				# End of data
+				break
+			except ValueError,why:
+				print "Problem reading data for `%s' (%s):\n"\
+				      "        %s"%(self.tag,control,why)
+				return list
+
+			list.append((None,control,item))
+
+			if len(data) == 0:
+				break
+
+		return list
+
+
+
+	def _split_labelled(self,data,ut=UT):
+		"""Split DATA (for a labelled field) into subfields.
+
+		UT is the unit terminator for delimited "A" subfields (see "wide_UT()").
+
+		Returns a list of tuples:
+
+			(subfield label, subfield control, subfield data)
+
+		where:
+			"subfield label"	is None or the expanded label for this
+						subfield. For a Cartesian label, this is
+						what you might expect. For a fixed array
+						field, this is the appropriate descriptive
+						index - for instance, "2,3".
+			"subfield control"	is None or a Control object, containing the
+						format control for this subfield.
+			"subfield data"		is a string containing the data for this
+						subfield.
+
+		Note that "X" controls are not labelled, and do not contribute to the
+		list, although they do cause data to be skipped.
+		"""
+
+		format = self.format_controls
+		labels = self.array_descriptor
+
+		list = []
+		bits = None		# not in a run of bit fields
+
+		if labels.variable:
+			# Work out the expanded labels for this variable array
+			labels_iter,data = self._find_var_labels(data)
+		else:
+			# We can just iterate over the array descriptor itself
+			labels_iter = labels
+
+		# Iterate throught the labels, keeping our own place in the
+		# format controls (so that they can be used for other data at once)
+
+		which = 0
+		for label in labels_iter:
+			# Get the format control for this item
+
+			control = format.control_at(which)
+			which   = which + 1
+
+			# "X" items are simply ignored - they are not labelled
+
+			while control.control == "X":
+				item,data,bits = read_packed_item(data,control,bits)
+				control   = format.control_at(which)
+				which     = which + 1
+				#print "Ignoring `X' item:",
+				#print item
+
+			#print "Label %s, format %s"%(label,control)
+
+			try:
+				item,data,bits = read_packed_item(data,control,bits,ut)
+			except IndexError:
+				# End of data
+				return list
+			except ValueError,why:
+				print "Problem reading data for `%s' (subfield %s, %s):\n"\
+				      "        %s\n" \
+				      "        Unread data: `%s'"% \
+				      (self.tag,label,control,why,printable(data))
+				return list
+
+			list.append((label,control,item))
+
+		return list
+
+
+	def _find_var_labels(self,data):
+		"""Work out the expanded labels for a variable array field's DATA.
+
+		Returns the tuple:
+
+			(labels,data)
+
+		where "labels" is a sequence of the expanded labels, and
+		      "data"   is what is left of the field's data
+		"""
+
+		# The array dimensions are in the data, as UT delimited integers
+
+		control = _var_array_control
+
+		# The first integer is the dimensionality
+
+		dimension,data = read_and_parse_item(data,control)
+
+		# Followed by that number of extents
+
+		extents = []
+		for count in range(dimension):
+			extent,data = read_and_parse_item(data,control)
+			extents.append(extent)
+
+		# So look up the label names for those extents (arrays with the
+		# same extents share the same labels)
+
+		return numeric_labels(extents),data
+
+
+	def split_fixed(self,data):
+		"""Split DATA into subfields in one go, if our format is all fixed width.
+
+		DATA is the field's data, without the final FT.
+
+		If every format control has a fixed width, the position of every
+		subfield is known in advance, and the whole field can be unpacked
+		by a single struct call (see "Format.fixed_struct()").
+
+		Returns a list of tuples, exactly as "Field.split()" does, or None
+		if this field cannot be split this way (in which case the caller
+		should fall back to splitting it one subfield at a time).
+		"""
+
+		try:
+			plan = self._fixed_plans[len(data)]
+		except KeyError:
+			plan = self._fixed_plan(len(data))
+
+		if plan == None:
+			return None
+
+		unpacker,names,controls,lsof = plan
+
+		items = unpacker.unpack_from(data)
+
+		# LSOF binary forms are returned in MSOF order (as "read_item" does)
+
+		if lsof:
+			items = [item for item in items]
+			for index in lsof:
+				items[index] = items[index][::-1]
+
+		return zip(names,controls,items)
+
+
+	def split_all_delimited(self,data):
+		"""Split DATA into subfields with a single split at each UT.
+
+		DATA is the field's data, without the final FT.
+
+		This is for fields whose format controls are all character
+		subfields ended by UT (see "Format.all_delimited"), which is very
+		common for attribute fields.
+
+		Returns a list of tuples, exactly as "Field.split()" does, or None
+		if this field cannot be split this way.
+		"""
+
+		format = self.format_controls
+		labels = self.array_descriptor
+
+		if format == None or labels == None or not format.all_delimited or \
+		   labels.variable:
+			return None
+
+		if data == "":
+			return []
+
+		items = string.split(data,UT)
+
+		# A final UT just ends the last subfield
+
+		if data[-1] == UT:
+			del items[-1]
+
+		names = self.label_list(len(items))
+
+		if names == None:
+			names = [None] * len(items)
+
+		return zip(names,format.controls_for(len(items)),items)
+
+
+	def split_delimited(self,data):
+		"""Split DATA into subfields with a compiled regular expression.
+
+		DATA is the field's data, without the final FT.
+
+		This is for fields whose format controls are all character
+		subfields (A, I, R, S or C), at least some of which are delimited
+		rather than of fixed width. The format controls before the repeat
+		are matched by one pattern, and each repeat by another (using
+		"finditer"), so the field is split in a few C level calls instead
+		of one "read_item()" per subfield.
+
+		Returns a list of tuples, exactly as "Field.split()" does, or None
+		if this field cannot be split this way (in which case the caller
+		should fall back to splitting it one subfield at a time).
+		"""
+
+		if not self._delimited_tried:
+			self._delimited_plan  = self._compile_delimited()
+			self._delimited_tried = TRUE
+
+		if self._delimited_plan == None:
+			return None
+
+		head_re,unit_re,head_controls,unit_controls = self._delimited_plan
+
+		length   = len(data)
+		items    = []
+		controls = []
+		posn     = 0
+
+		# Note that a subfield is only read if there is data left when we
+		# get to it, so we must ignore any groups that matched (empty) at
+		# the very end of the data
+
+		if head_re != None and posn < length:
+			match = head_re.match(data)
+
+			if match == None:
+				return None
+
+			self._add_matched(match,length,items)
+			controls.extend(head_controls)
+			posn = match.end()
+
+		if posn < length:
+			for match in unit_re.finditer(data,posn):
+				if match.start() != posn:
+					return None		# something we didn't expect
+
+				self._add_matched(match,length,items)
+				controls.extend(unit_controls)
+				posn = match.end()
+
+				if posn >= length:
+					break
+
+		if posn < length:
+			return None
+
+		names = self.label_list(len(items))
+
+		if names == None:
+			names = [None] * len(items)
+
+		return zip(names,controls,items)
+
+
+	def _add_matched(self,match,length,items):
+		"""Add the subfields found by MATCH to ITEMS (see "split_delimited()")."""
+
+		if match.end() < length:
+			items.extend(match.groups())
+		else:
+			for which in range(1,len(match.groups())+1):
+				if match.start(which) >= length:
+					break
+
+				items.append(match.group(which))
+
+
+	def _compile_delimited(self):
+		"""Compile the patterns used by "split_delimited()".
+
+		Returns (head pattern, repeat pattern, head controls, repeat controls),
+		or None if our format controls are not suitable.
+		"""
+
+		format = self.format_controls
+		labels = self.array_descriptor
+
+		if format == None or labels == None or format.count == 0 or \
+		   labels.variable or format.fixed:
+			return None
+
+		# (the "re" module only allows 100 groups in a pattern)
+
+		if format.repeat_from > 100 or format.repeat_count > 100:
+			return None
+
+		for control in format.walk():
+			if control.control not in ("A","I","R","S","C"):
+				return None
+
+			if control.form == "D" and len(control.size) != 1:
+				return None
+
+			if control.form not in (None,"D","W"):
+				return None
+
+		head_controls = tuple(format.walk(format.head_runs))
+		unit_controls = tuple(format.walk(format.repeat_runs))
+
+		# Name the groups after our labels, where they make usable names
+
+		names = self.label_list(len(head_controls) + len(unit_controls))
 
-		if self.level == 1:
-			self.data_field_name = read_to_FT(octets)
-		else:
-			# In 6.4.1, para 1, it says:
-			# "Missing elements of the data description shall be represented by
-			#  adjacent delimiters and a terminal string of adjacent delimiters
-			#  shall not be replaced by the field delimiter."
-			#        ^^^
-			# Some data written by the SDTS FIPS123 library (in particular) seems
-			# to disobey this - I need to check what the previous version of ISO 8211
-			# has to say, since that's what they've coded to...
+		if names == None:
+			names = []
 
-			# So how do we handle this?
-			# The two problems I've found are:
-			# 1) null array descriptor and format controls, so they omitted the UTs
-			# 2) terminating the data field name with an FT instead of a UT - it may
-			#    be that (1) is a special case of this
+		head_re = self._compile_pattern(head_controls,names[:len(head_controls)])
+		unit_re = self._compile_pattern(unit_controls,names[len(head_controls):])
 
-			# So first, try to read up to a terminating FT
-			# (at worst, this should read to the end of the field description)
+		return (head_re,unit_re,head_controls,unit_controls)
 
-			temp = read_to_FT(octets)
 
-			# Then try to do it correctly
+	def _compile_pattern(self,controls,names):
+		"""Compile a pattern matching the subfields for CONTROLS, or return None."""
 
-			try:
-				self.data_field_name = read_to_UT(octets)
-			except iso8211_syntax_error:
-				print "Warning: Data field name for `%s' was not terminated by UT\n" \
-				      "         Data read was: `%s'\n" \
-				      "         Assuming field name SHOULD be: `%s'"%\
-				      (self.tag,printable(octets),printable(temp))
+		if len(controls) == 0:
+			return None
 
-				self.data_field_name = temp
+		parts = []
+		used  = {}
 
-			# If reading it to a UT or FT gives us a shorter result than
-			# just reading to a UT, then we have found error (2) - so complain
-			# and use the `correct' data
+		for index in range(len(controls)):
+			control = controls[index]
 
-			if len(temp) < len(self.data_field_name):
-				print "Warning: Data field name for `%s' was terminated by FT "\
-				      "(instead of UT)\n" \
-				      "         Data read was: `%s'\n" \
-				      "         Assuming field name SHOULD be: `%s'"%\
-				      (self.tag,printable(octets),printable(temp))
+			# A subfield is either a fixed number of characters, or
+			# everything up to its delimiter (which is then skipped)
+			# or the end of the data
 
-				self.data_field_name = temp
+			if control.form == "W":
+				body = ".{%d}"%control.size
+				tail = ""
+			else:
+				if control.form == "D":
+					delim = re.escape(control.size)
+				else:
+					delim = re.escape(UT)
 
+				body = "[^%s]*"%delim
+				tail = "(?:%s|\\Z)"%delim
 
-	def _read_for_levels_2_and_3(self,tag,octets):
-		"""Read the array descriptor and format controls.
+			if index < len(names) and re.match("[A-Za-z_][A-Za-z0-9_]*$",names[index]) and \
+			   not used.has_key(names[index]):
+				used[names[index]] = TRUE
+				parts.append("(?P<%s>%s)%s"%(names[index],body,tail))
+			else:
+				parts.append("(%s)%s"%(body,tail))
 
-		These are only present for levels 2 and 3."""
+		return re.compile(string.join(parts,""),re.DOTALL)
 
-		# The array descriptor (if any) is up to the next UT
-		# (not forgetting to ignore the UT character that ended
-		# the data field name)
 
-		if len(octets) > 1:
+	def _fixed_plan(self,length):
+		"""Work out (and remember) how "split_fixed()" should split LENGTH octets.
 
-			array_desc = read_to_UT_or_FT(octets)
+		Returns (struct,labels,controls,LSOF indices), or None.
+		"""
 
-			
+		format = self.format_controls
+		labels = self.array_descriptor
+		plan   = None
 
-			try:
-				self.array_descriptor.parse(array_desc)
-			except iso8211_no_array_error:
-				# Give better data for this exception
-				# (the array descriptor can't see our octets)
-				raise iso8211_noarray_error,(self.tag,self.octets)
+		if format != None and labels != None and format.fixed and not labels.variable:
+			plan = format.fixed_struct(length)
 
-			# And the format controls (if any) come after that
-			# (not forgetting to ignore the UT or FT character
-			# that ended the array descriptor)
+		if plan != None:
+			names = self.label_list(len(plan[1]))
 
-			octets = octets[len(array_desc)+1:]
+			if names == None:
+				names = [None] * len(plan[1])
+			else:
+				# Labelled "X" subfields are awkward - leave them to the slow way
 
-			# If the array descriptor was ended by the terminal FT,
-			# then we may indeed not have any format controls
-			# So check the length of the string we're left with...
+				for control in plan[1]:
+					if control.control == "X":
+						plan = None
+						break
 
-			if len(octets) > 0:
-				self.format_controls.parse_with_FT(octets)
+				if plan != None and len(names) < len(plan[1]):
+					plan = format.fixed_struct(length,len(names))
 
+		if plan != None:
+			unpacker,controls = plan
 
-	def __del__(self):
-		"""Attempt to defeat any circular references we might have."""
+			lsof = []
+			for index in range(len(controls)):
+				control = controls[index]
+				if control.form == "B" and control.control[0] == "b":
+					lsof.append(index)
 
-		#if debugging:
-		#	print "__del__ for",`self`
+			plan = (unpacker,tuple(names[:len(controls)]),controls,tuple(lsof))
 
-		self.ddr = None
+		if len(self._fixed_plans) >= 64:
+			self._fixed_plans = {}
 
+		self._fixed_plans[length] = plan
 
-	def __repr__(self):
-		return "Field description for tag `"+self.tag+"'"
+		return plan
 
 
 	def _write_lab_fmt_vector(self,dfd,vector,width,count):
@@ -446,7 +1437,7 @@ class Field_desc:
 
 		got_X = FALSE
 
-		for item in format.flatlist:
+		for item in format.walk():
 			if item.control == "X":
 				got_X = TRUE
 				break
@@ -476,8 +1467,8 @@ class Field_desc:
 
 		self._stm_report(dfd,"Flat   count (labels) = %d"%early_labels)
 		self._stm_report(dfd,"Repeat count (labels) = %d"%final_labels)
-		self._stm_report(dfd,"Flat   count (format) = %d"%len(format.flatlist))
-		self._stm_report(dfd,"Repeat count (format) = %d"%len(format.repeat))
+		self._stm_report(dfd,"Flat   count (format) = %d"%format.count)
+		self._stm_report(dfd,"Repeat count (format) = %d"%format.repeat_count)
 
 		# Is that compatible with the format controls?
 
@@ -487,7 +1478,7 @@ class Field_desc:
 
 		if num_structures == 1:
 			self._stm_report(dfd,"Only one structure")
-			if final_labels == len(format.flatlist) == len(format.repeat):
+			if final_labels == format.count == format.repeat_count:
 				self._stm_report(dfd,"[OK] (Flat and repeat counts match)")
 				return TRUE
 			else:
@@ -500,8 +1491,8 @@ class Field_desc:
 
 		self._stm_report(dfd,"More than one structure")
 
-		if early_labels == len(format.flatlist) and \
-		   final_labels == len(format.repeat):
+		if early_labels == format.count and \
+		   final_labels == format.repeat_count:
 			self._stm_report(dfd,"[OK] (Flat and repeat counts match)")
 			return TRUE
 		else:
@@ -1227,10 +2218,18 @@ class Array_descriptor:
 					is either a Cartesian label or a fixed numeric
 					array descriptor
 
-	For handling expanded labels (if not "variable"):
+		labels			a tuple of the expanded labels for all of the
+					structures, in order (this is worked out when
+					the array descriptor is parsed)
+
+		table_from		the index in "labels" at which the final table
+					starts (or None if there is no table) - the
+					labels from here on repeat as necessary
+		table_size		the number of labels in that table
+
+	For "next_item()" and "rewind()" (if not "variable"):
 
-		current_structure	the current structure's index
-		current_index		the current expanded label's index in that structure
+		current_index		the current expanded label's index
 		current_item		the current expanded label
 
 
@@ -1238,6 +2237,9 @@ class Array_descriptor:
 
 		for label in array_desc:
 			<process label>
+
+	and that "item()" does not change anything, so that more than one
+	such loop can be going on at once.
 	"""
 
 	def __init__(self,tag,field_controls):
@@ -1255,8 +2257,7 @@ class Array_descriptor:
 
 		# Set up for iterating through the expanded labels
 
-		if not self.variable:
-			self.rewind()
+		self.rewind()
 
 
 	def _decide_default(self):
@@ -1316,6 +2317,26 @@ class Array_descriptor:
 			      "Array_descriptor (field `%s'): unknown data structure code `%s'"%\
 			      (self.tag,structure_code)
 
+		self._expand_labels()
+
+
+	def _expand_labels(self):
+		"""Work out the expanded labels for all of our structures."""
+
+		self.labels     = ()
+		self.table_from = None
+		self.table_size = 0
+
+		if self.variable:
+			return
+
+		for structure in self.structures:
+			if structure.is_table and len(structure.labels) > 0:
+				self.table_from = len(self.labels)
+				self.table_size = len(structure.labels)
+
+			self.labels = self.labels + structure.labels
+
 
 	def check(self,field_desc):
 		"""Check the array descriptor makes sense.
@@ -1339,13 +2360,6 @@ class Array_descriptor:
 				raise iso8211_noarray_error,(self.tag,field_desc.octets)
 
 
-	def __del__(self):
-		# Remove any references elsewhere
-
-		self.field_controls = None
-		self.structures     = None
-
-
 	def __repr__(self):
 		return "Array descriptor for tag `"+self.tag+"'"
 
@@ -1400,8 +2414,9 @@ class Array_descriptor:
 
 			self.check_legal()
 
-			# Finally, set up for iterating through the expanded labels
+			# Finally, work out the expanded labels
 
+			self._expand_labels()
 			self.rewind()
 
 
@@ -1428,7 +2443,7 @@ class Array_descriptor:
 
 
 	def __getitem__(self,which):
-		"""Used in iteration - get the n'th expanded label.
+		"""Get the n'th expanded label.
 
 		Returns expanded labels in order. If we are a table,
 		they will repeat as necessary.
@@ -1441,6 +2456,28 @@ class Array_descriptor:
 		return self.item(which)
 
 
+	def __iter__(self):
+		"""Iterate over the expanded labels.
+
+		If we end with a table, its labels repeat forever.
+
+		Raises ValueError if called for a variable dimension array.
+		"""
+
+		if self.variable:
+			raise ValueError,"Unable to determine labels for variable arrays"
+
+		for label in self.labels:
+			yield label
+
+		if self.table_from != None:
+			table = self.labels[self.table_from:]
+
+			while TRUE:
+				for label in table:
+					yield label
+
+
 	def item(self,which):
 		"""Return the expanded label with index "which".
 
@@ -1459,48 +2496,52 @@ class Array_descriptor:
 
 		if which < 0:
 			raise IndexError,"Index should be 0 or more, not %d"%which
-		elif which == self.current_index:
-			return self.current_item
-		elif which < self.current_index:
-			self.rewind()
-			while self.current_index < which:
-				label = self.next_item()
-			return label
+		elif which < len(self.labels):
+			return self.labels[which]
+		elif self.table_from != None:
+			# We're a table, so work out our position in the repeat
+
+			posn = (which - self.table_from) % self.table_size
+
+			return self.labels[self.table_from + posn]
 		else:
-			while self.current_index < which:
-				label = self.next_item()
-			return label
+			raise IndexError,"No more labels"
 
 
-	def next_item(self):
-		"""Return the next expanded label.
+	def first(self,count):
+		"""Return a tuple of (up to) the first COUNT expanded labels.
 
 		Raises ValueError if called for a variable dimension array.
-
-		Raises IndexError if there is no next label.
 		"""
 
 		if self.variable:
 			raise ValueError,"Unable to determine labels for variable arrays"
 
-		# Try the current structure first
+		if count <= len(self.labels) or self.table_from == None:
+			return self.labels[:count]
 
-		structure = self.structures[self.current_structure]
+		# Otherwise, we need to repeat the table often enough
 
-		try:
-			self.current_index = self.current_index + 1
-			self.current_item  = structure.item(self.current_index)
-		except IndexError:
-			# Hmm - is there another structure to try?
+		head    = self.labels[:self.table_from]
+		table   = self.labels[self.table_from:]
+		repeats = (count - self.table_from) / self.table_size + 1
+
+		return (head + table * repeats)[:count]
+
+
+	def next_item(self):
+		"""Return the next expanded label.
 
-			self.current_structure = self.current_structure + 1
+		This is just "item()" with the index after the last one asked for
+		(by "next_item()") - "item()" itself is not affected by this.
 
-			if self.current_structure > (len(self.structures) - 1):
-				raise IndexError,"No more labels"
+		Raises ValueError if called for a variable dimension array.
+
+		Raises IndexError if there is no next label.
+		"""
 
-			structure          = self.structures[self.current_structure]
-			self.current_index = 0
-			self.current_item  = structure.item(self.current_index)
+		self.current_item  = self.item(self.current_index + 1)
+		self.current_index = self.current_index + 1
 
 		return self.current_item
 
@@ -1510,14 +2551,8 @@ class Array_descriptor:
 
 		After calling this, "next_item()" will return the first
 		expanded label again.
-
-		Raises ValueError if called for a variable dimension array.
 		"""
 
-		if self.variable:
-			raise ValueError,"Unable to determine labels for variable arrays"
-
-		self.current_structure = 0
 		self.current_item      = None
 		self.current_index     = -1
 
@@ -1702,7 +2737,7 @@ class Simple_array_descriptor:
 		max_label_len		The length of the longest subfield label in the
 					Cartesian label
 
-		labels			A list of the expanded labels for this Cartesian label
+		labels			A tuple of the expanded labels for this Cartesian label
 
 		is_table		TRUE if we are a table
 
@@ -1710,7 +2745,7 @@ class Simple_array_descriptor:
 
 		extents			the extent in each dimension
 
-	For handling expanded labels:
+	For "next_item()" and "rewind()":
 
 		current_item		the current expanded label
 		current_index		the current expanded label's index
@@ -1735,7 +2770,7 @@ class Simple_array_descriptor:
 
 		# Set up for iteration
 
-		self.labels = []
+		self.labels = ()
 		self.rewind()
 
 		# And find out...
@@ -1743,12 +2778,6 @@ class Simple_array_descriptor:
 		self._parse()
 
 
-	def __del__(self):
-		# Remove any references elsewhere
-
-		self.parent = None
-
-
 	def __repr__(self):
 		return "Simple array descriptor for tag `"+self.tag+"'"
 
@@ -1854,10 +2883,10 @@ class Simple_array_descriptor:
 		"""Expand out the Cartesian labels."""
 
 		if self.labelled:
-			self.labels = self._expand_labels_lab(self.cartesian_label)
+			self.labels = tuple(self._expand_labels_lab(self.cartesian_label))
 		else:
 			#print self.dimension,self.extents
-			self.labels = expand_labels_num(self.extents)
+			self.labels = tuple(expand_labels_num(self.extents))
 
 
 	def _expand_labels_lab(self,vectors):
@@ -1888,7 +2917,7 @@ class Simple_array_descriptor:
 
 
 	def __getitem__(self,which):
-		"""Used in iteration - get the n'th expanded label.
+		"""Get the n'th expanded label.
 
 		Returns expanded labels in order. If we are a table,
 		they will repeat as necessary.
@@ -1901,6 +2930,18 @@ class Simple_array_descriptor:
 		return self.item(which)
 
 
+	def __iter__(self):
+		"""Iterate over the expanded labels (forever, if we are a table)."""
+
+		for label in self.labels:
+			yield label
+
+		if self.is_table and len(self.labels) > 0:
+			while TRUE:
+				for label in self.labels:
+					yield label
+
+
 	def item(self,which):
 		"""Return the expanded label with index "which".
 
@@ -1915,28 +2956,24 @@ class Simple_array_descriptor:
 		if which < 0:
 			raise IndexError,"Index should be 0 or more, not %d"%which
 		elif which < len(self.labels):
-			self.current_index = which
-			self.current_item  = self.labels[which]
-		elif self.is_table:
+			return self.labels[which]
+		elif self.is_table and len(self.labels) > 0:
 			# OK - we're a table, so we're into repeat territory
 			# Work out our position in the repeat...
 
-			posn = which % len(self.labels)
-
-			self.current_item  = self.labels[posn]
-			self.current_index = which
-
+			return self.labels[which % len(self.labels)]
 		else:
 			raise IndexError,\
 			      "Index should be 0 through %d, not %d"%(len(self.labels)-1,which)
 
-		return self.current_item
-
 
 	def next_item(self):
 		"""Return the next expanded label."""
 
-		return self.item(self.current_index + 1)
+		self.current_item  = self.item(self.current_index + 1)
+		self.current_index = self.current_index + 1
+
+		return self.current_item
 
 
 	def rewind(self):
@@ -2246,7 +3283,7 @@ class Format_controls(format.Format):
 
 		# (Should we raise an exception, or just grumble noisily?)
 
-		for item in self.flatlist:
+		for item in self.walk():
 			control = item.control
 
 			if control != guess:
@@ -2305,17 +3342,6 @@ class Format_controls(format.Format):
 				
 
 
-	def __del__(self):
-		# Remove any references elsewhere
-
-		self.field_controls = None
-
-		# And do our parent's stuff as well, for safety
-
-		format.Format.__del__(self)
-
-
-
 	def __repr__(self):
 		return "Format controls for tag `"+self.tag+"'"
 
@@ -2368,6 +3394,134 @@ def expand_labels_num(extents):
 				labels.append(`count` + "," + label)
 
 	return labels
+
+
+# ----------------------------------------------------------------------
+# The labels for variable arrays are remembered by their extents, so that
+# fields with arrays of the same shape can share them (but we don't
+# remember too many, and very large arrays get labels worked out as they
+# are wanted, rather than all at once)
+
+numeric_labels_cache_size = 64
+numeric_labels_limit      = 10000
+
+_numeric_labels_cache = {}
+
+def numeric_labels(extents):
+	"""Return the labels generated from the given numeric extents.
+
+	EXTENTS is a list (or tuple) of the array extents.
+
+	This returns the same labels as "expand_labels_num()", but as a tuple
+	(or, if there are more than "numeric_labels_limit" of them, as a
+	Numeric_labels object). The result is remembered, so asking again
+	for the same extents just returns the same object.
+	"""
+
+	key = tuple(extents)
+
+	try:
+		return _numeric_labels_cache[key]
+	except KeyError:
+		pass
+
+	size = 1
+	for extent in key:
+		size = size * extent
+
+	if len(key) == 0:
+		labels = ()
+	elif size > numeric_labels_limit:
+		labels = Numeric_labels(key)
+	else:
+		labels = tuple(expand_labels_num([extent for extent in key]))
+
+	if len(_numeric_labels_cache) >= numeric_labels_cache_size:
+		_numeric_labels_cache.clear()
+
+	_numeric_labels_cache[key] = labels
+
+	return labels
+
+
+
+# ----------------------------------------------------------------------
+class Numeric_labels:
+	"""The labels for a numeric array, worked out as they are wanted.
+
+	Initialisation arguments:
+
+		extents		the extent in each dimension
+
+	This behaves like a tuple of the labels "expand_labels_num()" would
+	return (so, for instance, item 0 of a 2 dimensional array is "1,1"),
+	without having to hold them all at once.
+	"""
+
+	def __init__(self,extents):
+
+		self.extents = tuple(extents)
+		self.length  = 1
+
+		for extent in self.extents:
+			self.length = self.length * extent
+
+
+	def __repr__(self):
+		return "Numeric labels for extents %s"%(`self.extents`)
+
+
+	def __len__(self):
+		return self.length
+
+
+	def __getitem__(self,which):
+
+		if isinstance(which,slice):
+			return tuple([self[index] for index in xrange(*which.indices(self.length))])
+
+		if which < 0:
+			which = which + self.length
+
+		if which < 0 or which >= self.length:
+			raise IndexError,\
+			      "Index should be 0 through %d, not %d"%(self.length-1,which)
+
+		# Work out the index in each dimension, last one first
+
+		indices = []
+		for extent in self.extents[::-1]:
+			which,index = divmod(which,extent)
+			indices.append(`index + 1`)
+
+		indices.reverse()
+
+		return string.join(indices,",")
+
+
+	def __iter__(self):
+
+		if self.length == 0:
+			return
+
+		# Count through the indices, with the last one changing fastest
+
+		indices = [1] * len(self.extents)
+		last    = len(self.extents) - 1
+
+		for count in xrange(self.length):
+			yield string.join([`index` for index in indices],",")
+
+			which = last
+			while which >= 0:
+				indices[which] = indices[which] + 1
+
+				if indices[which] <= self.extents[which]:
+					break
+
+				indices[which] = 1
+				which = which - 1
+
 
 # ----------------------------------------------------------------------
 def test_array_sub(a,desc):
@@ -2402,3 +3556,143 @@ def test_array():
 	test_array_sub(a,"A!B*C!D\\\\X!Y*Z")
 	test_array_sub(a,"A!B*C!D\\\\*X!Y")
 
+
+# ----------------------------------------------------------------------
+class _Test_leader:
+	"""Just enough of a DDR's leader for the tests below."""
+
+	interchange_level      = 3
+	field_control_length   = 6
+	extended_character_set = " ! "
+
+class _Test_DDR:
+	"""Just enough of a DDR for the tests below."""
+
+	def __init__(self):
+		self.leader     = _Test_leader()
+		self.parents    = {}
+		self.child_list = []
+		self.ddf        = None
+		self._interning = None
+
+def _test_desc(tag,field_controls,labels,formats):
+	"""Return a Field_desc for TAG, made from the given parts."""
+
+	return Field_desc(_Test_DDR(),tag,
+			  field_controls + "Test" + UT + labels + UT + formats + FT)
+
+
+def test_find_subfield():
+	"""Check "find_subfield()" against "split()", on truncated data as well."""
+
+	desc = _test_desc("TEST","1600;&","A!B!C","(A(2),I(3),b12)")
+	data = "ab123" + "\x34\x12"
+	ends = {"A":2, "B":5, "C":7}
+
+	for length in range(len(data)+1):
+		short = data[:length]
+		split = {}
+
+		for label,control,item in desc.split(short):
+			split[label] = item
+
+		for label in ("A","B","C"):
+			try:
+				found = desc.find_subfield(short,label)
+			except KeyError:
+				found = None
+
+			if length >= ends[label]:
+				wanted = split[label]
+			else:
+				wanted = None
+
+			if found != wanted:
+				raise AssertionError,"Subfield %s of %s: got %s, wanted %s"%\
+				      (label,`short`,`found`,`wanted`)
+
+	# If the part of the format that repeats is all "X" controls, the
+	# labels after the first unit don't have a subfield (and we mustn't
+	# go round the "X" controls for ever looking for one)
+
+	for labels,formats,found in (("L0","(3X(1))",{}),
+				     ("L0!L1!L2!L3!L4","(X(1),(I(,),2(X(1))))",
+				      {"L0":"12"})):
+		desc = _test_desc("TEST","1600;&",labels,formats)
+
+		for label in string.split(labels,"!"):
+			try:
+				item = desc.find_subfield("x12,ab34,cd",label)
+			except KeyError:
+				item = None
+
+			if item != found.get(label):
+				raise AssertionError,"Subfield %s for %s: got %s, wanted %s"%\
+				      (label,formats,`item`,`found.get(label)`)
+
+	print "find_subfield: OK"
+
+
+def test_units():
+	"""Check "unit_count()" and "unit()" against "split()"."""
+
+	desc = _test_desc("TEST","1600;&","","(A(1),(2I(2)))")
+	data = "a" + "0102" + "0304" + "0506"
+
+	if desc.unit_count(data) != 3:
+		raise AssertionError,"Expected 3 units, got %s"%desc.unit_count(data)
+
+	split = desc.split(data)
+
+	for which in range(3):
+		if desc.unit(data,which) != split[1+which*2:3+which*2]:
+			raise AssertionError,"Unit %d is %s"%(which,desc.unit(data,which))
+
+	# A variable array's data starts with its dimensions, so it doesn't
+	# have units we can find by position
+
+	desc = _test_desc("TEST","2600;&","","(I(2))")
+	data = "2" + UT + "2" + UT + "3" + UT + "010203040506"
+
+	if desc.unit_count(data) != None:
+		raise AssertionError,"Expected no units, got %s"%desc.unit_count(data)
+
+	try:
+		desc.unit(data,0)
+	except ValueError,detail:
+		if str(detail) != "Field `TEST' does not have fixed width units":
+			raise AssertionError,"Unexpected ValueError: %s"%detail
+	else:
+		raise AssertionError,"Expected a ValueError for a variable array"
+
+	print "units: OK"
+
+
+
+def test_wide_charset():
+	"""Check splitting character subfields that are in UCS-2."""
+
+	desc = _test_desc("TEST","1600;&","A!B","(A,A)")
+	desc.ddr.leader.extended_character_set = "%/@"
+
+	# (the first subfield contains "\x00\x1f", but not on a character boundary,
+	#  and the data ends with what is left of the FT)
+
+	first  = u"\u2000\u1f30".encode("utf-16-be")
+	second = u"b".encode("utf-16-be")
+	data   = first + "\x00\x1f" + second + "\x00\x1f" + "\x00"
+
+	split = desc.split(data)
+
+	if [item for label,control,item in split] != [first,second]:
+		raise AssertionError,"Split into %s"%split
+
+	if desc.find_subfield(data,"B") != second:
+		raise AssertionError,"Subfield B is %s"%`desc.find_subfield(data,"B")`
+
+	decoded = [item for label,control,item in desc.decode(split)]
+
+	if decoded != [u"\u2000\u1f30",u"b"]:
+		raise AssertionError,"Decoded to %s"%decoded
+
+	print "wide charset: OK"
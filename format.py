@@ -48,6 +48,8 @@ import sys
 import os
 import array
 import string
+import struct
+import bisect
 from math import ceil
 
 import misc
@@ -82,9 +84,19 @@ class Format(object):
 
 		controls	a list of Repeat and Control objects
 
+		runs		a flattened version of "controls", as a list of
+				(controls,times) tuples - each meaning that the
+				tuple of Control objects "controls" occurs "times"
+				times in a row (so "(1000A(1))" is a single run,
+				rather than a thousand Control objects)
+
+		head_runs	the runs before "repeat_from"
+		repeat_runs	the runs from "repeat_from" onwards
+
 		flatlist	a flattened version of "controls", containing
 				only Control objects (that is, with all explicit
-				repeats iterated out)
+				repeats iterated out) - this is worked out from
+				"runs" when it is first asked for
 
 		count		the number of explicit format controls in this
 				object (this is identical to "len(flatlist)",
@@ -94,7 +106,10 @@ class Format(object):
 				repetition would start (or None if none)
 
 		repeat		the slice of "flatlist" which is repeated
-				(this is flatlist[repeat_from:])
+				(this is flatlist[repeat_from:], and is also
+				only worked out when it is first asked for)
+
+		repeat_count	the number of controls in "repeat"
 
 
 		current_item	the current Control object
@@ -102,6 +117,16 @@ class Format(object):
 
 		unit_size       the unit size of a field, 0 indicates that a
 		                field is delimited or has a single value
+
+		all_delimited	TRUE if every control is a character control
+				terminated by UT (so "(A,I,R)" or "(A)"), so that
+				the data can simply be split at each UT
+
+		fixed		TRUE if every control has a fixed width, so that
+				the position of every subfield is known in advance
+		head_size	the width of the controls before "repeat_from"
+		repeat_size	the width of the controls in "repeat"
+				(these two are only meaningful if "fixed" is TRUE)
 		
 	Usage:
 
@@ -129,8 +154,20 @@ class Format(object):
 
 		for which in range(fmt.count):
 			print "item %s"%fmt.item(which)
+
+	   or, without indexing at all:
+
+		for item in fmt.walk():
+			print "item %s"%item
 	"""
 
+	__slots__ = ("octets","extended_chars","controls","count",
+		     "current_index","current_item","runs","head_runs",
+		     "repeat_runs","repeat_from","repeat_count","fixed",
+		     "all_delimited","head_size","repeat_size","unit_size",
+		     "_run_starts","_control_list","_flatlist","_repeat",
+		     "_structs","_unit_struct")
+
 	def __init__(self):
 
 		# We start off `empty'
@@ -142,10 +179,6 @@ class Format(object):
 		self.extended_chars = FALSE
 
 
-	def __del__(self):
-		pass
-
-
 	def __repr__(self):
 		return "Format: %s"%(`self.octets`)
 
@@ -173,15 +206,29 @@ class Format(object):
 
 		self.octets	 = ""
 		self.controls    = []
-		self.flatlist    = []
+		self.runs        = []
+		self.head_runs   = []
+		self.repeat_runs = []
 		self.repeat_from = None
-		self.repeat	 = []
+		self.repeat_count = 0
+
+		self._flatlist   = None
+		self._repeat     = None
+		self._run_starts = []
 
 		self.current_item  = None
 		self.current_index = -1		# i.e., the first item will be the next
 		self.count         = 0
 		self.unit_size     = 0
 
+		self.all_delimited = FALSE
+		self.fixed         = FALSE
+		self.head_size     = 0
+		self.repeat_size   = 0
+		self._structs      = {}
+		self._unit_struct  = None
+		self._control_list = []
+
 
 	def _start_parse(self):
 		"""Perform processing required before a format is defined."""
@@ -259,25 +306,167 @@ class Format(object):
 	def _end_parse(self):
 		"""Perform processing required when a format has been defined."""
 
-		# Flatten the resulting format
+		# Flatten the resulting format (which also gives us its length)
 
 		self._flatten()
 
-		# Which gives us the format length
-
-		self.count = len(self.flatlist)
-
-		# And enables us to work out the repeat slice
+		# And work out the repeat slice
 
 		if self.repeat_from != None:
-			self.repeat = self.flatlist[self.repeat_from:]
+			self.head_runs,self.repeat_runs = self._split_runs(self.repeat_from)
+			self.repeat_count = self.count - self.repeat_from
 		else:
-			self.repeat = []
+			self.head_runs    = self.runs
+			self.repeat_runs  = []
+			self.repeat_count = 0
 
 		# Look for a REPEAT TO END
 
 		self._look_for_REPEAT_TO_END()
 
+		# And see if we can split data at UTs, or unpack it with a struct
+
+		self._check_all_delimited()
+		self._check_fixed()
+
+
+	def _check_all_delimited(self):
+		"""Work out if all our controls are character controls ended by UT."""
+
+		self._control_list = []
+		self.all_delimited = (self.count > 0)
+
+		for controls,times in self.runs:
+			for control in controls:
+				if control.form != None or control.control not in ("A","I","R","S","C"):
+					self.all_delimited = FALSE
+					return
+
+
+	def controls_for(self,count):
+		"""Return a list of the first COUNT Control objects.
+
+		This is the same as [fmt.control_at(0), ..., fmt.control_at(COUNT-1)],
+		but the list is remembered, and just extended when a longer one
+		is wanted.
+		"""
+
+		controls = self._control_list
+
+		if len(controls) < count:
+			more = [self.control_at(which) for which in range(len(controls),count)]
+
+			controls = controls + more
+
+			self._control_list = controls
+
+		return controls[:count]
+
+
+	def _check_fixed(self):
+		"""Work out if all our controls are fixed width, and if so how wide."""
+
+		self.fixed        = FALSE
+		self.head_size    = 0
+		self.repeat_size  = 0
+		self._structs     = {}
+		self._unit_struct = None
+
+		if self.count == 0:
+			return
+
+		for controls,times in self.runs:
+			for control in controls:
+				if control.struct_code == None:
+					return
+
+		self.head_size   = self._runs_width(self.head_runs)
+		self.repeat_size = self._runs_width(self.repeat_runs)
+
+		self.fixed = (self.repeat_size > 0)
+
+
+	def fixed_struct(self,length,limit=None):
+		"""Return a plan for unpacking LENGTH octets of data in a single call.
+
+		This is only possible if the format is "fixed", and LENGTH is the
+		width of the controls before the repeat plus a whole number of
+		repeats. If LIMIT is given, then no more than LIMIT controls are
+		unpacked (this is used when there are fewer labels than subfields).
+
+		Returns the tuple:
+
+			(struct,controls)
+
+		where "struct" is a struct.Struct which unpacks the data into a
+		tuple of strings (one for each subfield), and "controls" is a tuple
+		of the corresponding Control objects. Returns None if the data cannot
+		be unpacked this way.
+
+		The structs are cached (by number of controls), since the same field
+		usually turns up with only a few different lengths.
+		"""
+
+		if not self.fixed or length < self.head_size:
+			return None
+
+		repeats,left = divmod(length - self.head_size,self.repeat_size)
+
+		if left != 0:
+			return None
+
+		count = self.repeat_from + repeats * self.repeat_count
+
+		if limit != None and limit < count:
+			count = limit
+
+		try:
+			return self._structs[count]
+		except KeyError:
+			pass
+
+		controls = []
+		codes    = []
+
+		for which in range(count):
+			control = self.control_at(which)
+			controls.append(control)
+			codes.append(control.struct_code)
+
+		plan = (struct.Struct("="+string.join(codes,"")),tuple(controls))
+
+		if len(self._structs) >= 64:
+			self._structs = {}
+
+		self._structs[count] = plan
+
+		return plan
+
+
+	def unit_struct(self):
+		"""Return a plan for unpacking a single repeat of the format.
+
+		This is only possible if the format is "fixed". Returns the tuple:
+
+			(struct,controls)
+
+		where "struct" is a struct.Struct which unpacks "repeat_size"
+		octets into a tuple of strings (one for each subfield in the
+		repeat), and "controls" is a tuple of the corresponding Control
+		objects. Returns None if the format is not "fixed".
+		"""
+
+		if not self.fixed:
+			return None
+
+		if self._unit_struct == None:
+			controls = tuple(self.walk(self.repeat_runs))
+			codes    = [control.struct_code for control in controls]
+
+			self._unit_struct = (struct.Struct("="+string.join(codes,"")),controls)
+
+		return self._unit_struct
+
 
 	def parse(self,octets):
 		"""Parse the ISO 8211 format control string OCTETS."""
@@ -371,26 +560,144 @@ class Format(object):
 		string).
 		"""
 
+		self.current_item  = self.control_at(which)
+		self.current_index = which
+
+		return self.current_item
+
+
+	def control_at(self,which):
+		"""Return the Control object with index "which".
+
+		This is "item()" without the side effect of changing the current
+		item, so it is safe to use while something else is iterating over
+		the format.
+		"""
+
 		if which < 0:
 			raise IndexError,"Index should be 0 or more, not %d"%which
-		elif which < len(self.flatlist):
-			self.current_index = which
-			self.current_item  = self.flatlist[which]
-		else:
+		elif which >= self.count:
 			# OK - we're into repeat territory
 
-			if self.repeat_from == None:
+			if self.repeat_from == None or self.repeat_count == 0:
 				raise IndexError,"Format `%s' does not repeat"%self.octets
 
 			# Work out our position in the repeat list...
 
-			posn = which - len(self.flatlist)
-			posn = posn % len(self.repeat)
+			posn  = (which - self.count) % self.repeat_count
+			which = self.repeat_from + posn
 
-			self.current_item  = self.repeat[posn]
-			self.current_index = which
+		# Find the run containing that index, and our position within it
 
-		return self.current_item
+		index = bisect.bisect_right(self._run_starts,which) - 1
+
+		controls,times = self.runs[index]
+
+		return controls[(which - self._run_starts[index]) % len(controls)]
+
+
+	def walk(self,runs=None):
+		"""Iterate over each Control object once, in order.
+
+		This goes over the controls in RUNS (default "runs"), without
+		building a list of them. Unlike iterating over the format itself,
+		it does not go on to repeat them.
+		"""
+
+		if runs == None:
+			runs = self.runs
+
+		for controls,times in runs:
+			for count in xrange(times):
+				for control in controls:
+					yield control
+
+
+	def walk_forever(self):
+		"""Iterate over the Control objects in order, repeating as necessary.
+
+		This is like iterating over the format itself, except that it does
+		not change "current_item" and "current_index".
+		"""
+
+		for control in self.walk():
+			yield control
+
+		if self.repeat_count > 0:
+			while TRUE:
+				for control in self.walk(self.repeat_runs):
+					yield control
+
+
+	def _get_flatlist(self):
+		if self._flatlist == None:
+			self._flatlist = [control for control in self.walk()]
+
+		return self._flatlist
+
+	flatlist = property(_get_flatlist,
+			    doc="The Control objects, with all explicit repeats iterated out")
+
+
+	def _get_repeat(self):
+		if self._repeat == None:
+			self._repeat = [control for control in self.walk(self.repeat_runs)]
+
+		return self._repeat
+
+	repeat = property(_get_repeat,doc="The slice of \"flatlist\" which is repeated")
+
+
+	def _runs_width(self,runs):
+		"""Return the total byte width of the controls in RUNS."""
+
+		width = 0
+
+		for controls,times in runs:
+			for control in controls:
+				width = width + times * control.byte_width
+
+		return width
+
+
+	def _split_runs(self,at):
+		"""Split "runs" in two at index AT, returning (before,after).
+
+		A run which straddles AT is itself split into up to three
+		runs, so that each side only contains its own controls.
+		"""
+
+		before = []
+		after  = []
+		start  = 0
+
+		for controls,times in self.runs:
+			length = len(controls) * times
+
+			if start + length <= at:
+				before.append((controls,times))
+			elif start >= at:
+				after.append((controls,times))
+			else:
+				# Work out how many whole repetitions come first, and
+				# where in the next one the split falls
+
+				whole,part = divmod(at - start,len(controls))
+
+				if whole > 0:
+					before.append((controls,whole))
+
+				if part > 0:
+					before.append((controls[:part],1))
+					after.append((controls[part:],1))
+					whole = whole + 1
+
+				if times - whole > 0:
+					after.append((controls,times - whole))
+
+			start = start + length
+
+		return (before,after)
 
 
 	def next_item(self):
@@ -414,47 +721,89 @@ class Format(object):
 		self.current_index = -1
 
 
-	def _flatten_item(self,item):
-		"""Flatten a given item from the format control list into "flatlist"."""
+	def _flatten_item(self,item,runs,start):
+		"""Flatten a given item from the format control list into RUNS.
+
+		START is the index (in the flattened controls) at which the item
+		starts. Returns the number of controls the item flattens out to.
+		"""
 
 		# Do what seems indicated by its type
 
 		if item.is_control:
 
-			# It's a format control - simply iterate out the repeat
+			# It's a format control - which is simply a run
 
-			for count in range(item.repeat):
-				self.flatlist.append(item.control)
+			if item.repeat > 0:
+				runs.append(((item.control,),item.repeat))
 
-		else:
+			return item.repeat
 
-			# It's a repeat clause
-			# Note at what index in the flatlist the first entry
-			# for the repeat clause will be inserted
+		# It's a repeat clause
+		# Flatten out the clause once, noting whether it contains
+		# any repeat clauses of its own
 
-			self.repeat_from = len(self.flatlist)
+		self.repeat_from = None
 
-			# And flatten out the clause the appropriate number of times
+		clause = []
+		length = self._flatten_list(item.clause,clause,start)
+
+		# Repetition starts where the last repeat clause flattened out
+		# started - which is this one, unless it contains another (in
+		# which case it is the one in the last repetition of this)
+
+		if self.repeat_from == None or item.repeat == 0:
+			self.repeat_from = start
+		else:
+			self.repeat_from = self.repeat_from + (item.repeat - 1) * length
+
+		# And `repeat' the clause the appropriate number of times,
+		# without actually iterating it out
+
+		if item.repeat == 0 or length == 0:
+			pass
+		elif item.repeat == 1:
+			runs.extend(clause)
+		elif len(clause) == 1:
+			controls,times = clause[0]
+			runs.append((controls,times * item.repeat))
+		else:
+			controls = ()
+			for inner,times in clause:
+				controls = controls + inner * times
 
-			for count in range(item.repeat):
-				self._flatten_list(item.clause)
+			runs.append((controls,item.repeat))
 
+		return length * item.repeat
 
 
-	def _flatten_list(self,list):
-		"""Add a flattened format control list to "flatlist"."""
+	def _flatten_list(self,list,runs,start):
+		"""Add a flattened format control list to RUNS, returning its length."""
+
+		length = 0
 
 		for item in list:
-			self._flatten_item(item)
+			length = length + self._flatten_item(item,runs,start + length)
+
+		return length
 
 
 	def _flatten(self):
-		"""Flatten the "controls" list into the "flatlist"."""
+		"""Flatten the "controls" list into "runs"."""
 
-		self.flatlist    = []
+		self.runs        = []
 		self.repeat_from = 0	# A reasonable guess
 
-		self._flatten_list(self.controls)
+		self.count = self._flatten_list(self.controls,self.runs,0)
+
+		# Remember where each run starts, so that we can find them quickly
+
+		self._run_starts = []
+		start = 0
+
+		for controls,times in self.runs:
+			self._run_starts.append(start)
+			start = start + len(controls) * times
 
 
 	def _write_nesting(self,dfd,nesting,indent):
@@ -564,12 +913,6 @@ class FormatParser:
 		self.next   = 0		# next character we're looking at
 
 
-	def __del__(self):
-		# Remove any depencies, just in case
-
-		self.format = None
-
-
 	def _read_repeat_count(self):
 		"""Read and return a repeat count - no count means 1.
 
@@ -916,7 +1259,7 @@ class FormatParser:
 
 
 # ----------------------------------------------------------------------
-class Repeat:
+class Repeat(object):
 	"""A repeat object, containing either a repeat clause or a Control object.
 
 	Initialisation arguments:
@@ -944,6 +1287,9 @@ class Repeat:
 		                undetermined/delimited
 	"""
 
+	__slots__ = ("repeat","clause","control","is_control",
+		     "repeat_to_end","byte_width")
+
 	def __init__(self,count,clause=None,control=None):
 
 		# Check we have the right number of arguments
@@ -980,13 +1326,6 @@ class Repeat:
 
 		return sum
 
-	def __del__(self):
-		# Make some attempt to tidy up
-
-		self.clause  = None
-		self.control = None
-
-
 	def __repr__(self):
 		if self.is_control:
 			return "%d %s"%(self.repeat,self.control)
@@ -1002,7 +1341,7 @@ class Repeat:
 
 
 # ----------------------------------------------------------------------
-class Control:
+class Control(object):
 	"""A single format control
 
 	Initialisation arguments:
@@ -1024,6 +1363,10 @@ class Control:
 	        byte_width      the width in bytes of this control, if known (not for
 		                delimited fields). Otherwise 0.
 
+		struct_code	the "struct" module code for the octets of this
+				control, if it has a fixed width (so "3s" for
+				"A(3)" or "b14"), and otherwise None
+
 
 	A Control object contains:
 
@@ -1031,6 +1374,8 @@ class Control:
 
 	"""
 
+	__slots__ = ("control","form","size","byte_width","struct_code")
+
 	def __init__(self,control,form,size):
 
 		#print "Init control:", control, form, size
@@ -1045,7 +1390,15 @@ class Control:
 		self.byte_width = 0
 		
 		if form == "W":
-			self.byte_width = self.size
+			if control == "B":
+				# "B(size)" gives the width in bits, and anything that
+				# isn't a whole number of octets is packed with its
+				# neighbours, so doesn't have a width of its own
+
+				if self.size % 8 == 0:
+					self.byte_width = self.size / 8
+			else:
+				self.byte_width = self.size
 			
 		# special case for binary widths
 		if form == "B":
@@ -1055,9 +1408,14 @@ class Control:
 			else:
 				print "Binary control without size."
 
-	def __del__(self):
-		pass
+		# If we know our width, we can be unpacked with "struct"
+		# (except for complex binary forms, which are read as two
+		#  values of the given width)
 
+		if self.byte_width > 0 and not (form == "B" and control[1] == "5"):
+			self.struct_code = "%ds"%self.byte_width
+		else:
+			self.struct_code = None
 
 	def __repr__(self):
 		if self.form == "D":
@@ -68,10 +68,26 @@ The structure of a DDF (as held here) is:
 
 import sys
 import os
+import re
+import copy
+import mmap
 import array
 import string
+import struct
+import weakref
+import UserDict
 import Dates
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import new as md5
+
 # import ni; ni.ni()
 
 from   misc       import *
@@ -113,6 +129,14 @@ class DDF:
 
 		ddr			the DDR (data definition record, record 0)
 
+		validate		how carefully records are checked as they are
+					read (see "open()")
+
+		charset			if set, the name of the Python codec used to
+					decode character subfields (see
+					"Field_desc.charset()") - otherwise, this is
+					decided from the DDR (the default is None)
+
 	It is possible to iterate over the records in a DDF:
 
 		ddf = iso8211.DDF
@@ -124,6 +148,10 @@ class DDF:
 
 	This example "show"s each record, starting with the first data record
 	(i.e., it starts with record 1, not record 0, the DDR).
+
+	When only the data is wanted, "visit()" reads through the data records
+	without making Record and Field objects at all. In between the two,
+	"scan()" reads each data record into the same Record object in turn.
 	"""
 
 	def __init__(self):
@@ -133,15 +161,6 @@ class DDF:
 		self._unset_things()
 
 
-	def __del__(self):
-		"""Delete a DDF - closes the relevent file."""
-
-		#if debugging:
-		#	print "__del__ for",`self`
-
-		self.close(self)
-
-
 	def __repr__(self):
 		if self.file != None:
 			return "ISO 8211 DDF " + self.name
@@ -163,12 +182,33 @@ class DDF:
 		return record
 
 
-	def open(self,name,mode="r"):
+	def open(self,name,mode="r",validate="strict"):
 		"""Open the named DDF.
 
 		name	the name of a DDF
 		mode	the mode to open it with - currently only "r" (read)
 			is supported, and that is also the default
+		validate
+			how carefully to check records as they are read:
+
+			"strict"	check the structure of each record, and
+					print warnings about anything odd (such as
+					a leader that doesn't match the DDR's) -
+					this is the default. All the DDR's field
+					definitions are also worked out straight
+					away (otherwise, each is only worked out
+					when it is first wanted - see
+					Field_desc_dict - so it is only with
+					"basic" or "none" that a program which
+					uses a few of many tags starts up
+					faster)
+			"basic"		check the structure of each record (that
+					directories are the right size, and that
+					directories and fields end with FT), but
+					don't look for anything else
+			"none"		don't check anything - for files that are
+					known to be good (for instance, because
+					we wrote them ourselves)
 		"""
 
 		# Check we don't already have a file open
@@ -181,6 +221,11 @@ class DDF:
 		if mode != "r":
 			raise iso8211_mode_error,mode
 
+		if validate not in ("strict","basic","none"):
+			raise iso8211_error,"Unknown validation `%s'"%validate
+
+		self.validate = validate
+
 		# OK - we're safe - try to open the file
 		# (use `binary' mode for safety - this doesn't do anything on
 		#  some systems, but should be safe anyway, I believe)
@@ -215,12 +260,18 @@ class DDF:
 		self.current_record = None	# no current record
 		self.ddr	    = None	# no DDR
 
+		self.charset        = None	# use the DDR's character sets
+
+		self._intern_table  = None	# no subfield values are interned
+		self._intern_labels = None
+		self.validate       = "strict"	# check everything as we read it
+
 		self.R_index	    = None	# we haven't found an "R" record, so
 		self.R_leader       = None	# we don't need to remember any information
 		self.R_directory    = None	# about it...
 
 
-	def next_record(self):
+	def next_record(self,reuse=None):
 		"""Return the next logical record in the DDF.
 
 		This also becomes the current record.
@@ -228,6 +279,10 @@ class DDF:
 		Note that if the file was opened with mode "r" then record 0 (the DDR)
 		will have been read in automatically when the file was opened, and
 		will be the current record (so the `next' record will be record 1).
+
+		If REUSE is given, it is a (data) Record that has already been read,
+		and the next record is read into it (and its leader, directory and
+		field area), rather than new ones being made - see "scan()".
 		"""
 
 		# TODO: Hmmm. There has to be a better way to do this.
@@ -236,7 +291,12 @@ class DDF:
 		if self.file == None:
 			raise iso8211_file_error,"There is no file open"
 
-		self.current_record = Record(self,self.next_posn,self.next_index)
+		if reuse == None:
+			self.current_record = Record(self,self.next_posn,self.next_index)
+		else:
+			reuse._reread(self.next_posn,self.next_index)
+			self.current_record = reuse
+
 		self.next_posn      = self.next_posn  + self.current_record.length
 		self.next_index     = self.next_index + 1
 
@@ -279,6 +339,65 @@ class DDF:
 		return self.current_record
 
 
+	def scan(self,reuse=TRUE):
+		"""Iterate over the data records (starting with record 1).
+
+		If REUSE is true (the default), the same Record object, with the same
+		leader, directory and field area, is read into for each record in
+		turn, rather than new ones being made - which saves a lot of work
+		when reading through a large file. This means that each record
+		yielded is only valid until the next one is asked for (and the same
+		goes for any Field got from it) - use "Record.detach()" to keep a
+		record for longer:
+
+			kept = []
+			for record in ddf.scan():
+				if record.has_tag("VRID"):
+					kept.append(record.detach())
+
+		If REUSE is false, a new Record is made for each record, just as
+		when iterating over the DDF.
+
+		Each record becomes the current record as it is read, and the scan
+		stops at the end of the file (or at the circumflexes that some files
+		are padded with at the end).
+		"""
+
+		if self.file == None:
+			raise iso8211_file_error,"There is no file open"
+
+		size = os.fstat(self.file.fileno())[6]
+
+		# Start again, with the DDR as the current record
+
+		self.rewind()
+
+		self.current_record = self.ddr
+		self.next_index     = 1
+		self.next_posn      = self.ddr.length
+
+		record = None
+
+		while self.next_posn < size:
+			# (the records after an "R" record are just a field area,
+			#  whose length is worked out as in "Record._read()")
+
+			if self.R_leader == None:
+				if self._padding_at(self.next_posn):
+					return
+			elif self._padding_at(self.next_posn,
+					      self.R_leader.record_length - \
+					      self.R_leader.base_address):
+				return
+
+			if reuse and record != None:
+				record = self.next_record(record)
+			else:
+				record = self.next_record()
+
+			yield record
+
+
 	def rewind(self):
 		"""Rewind to the start of the DDF.
 
@@ -297,6 +416,323 @@ class DDF:
 		self.R_directory = None
 
 
+	def _padding_at(self,posn,length=None):
+		"""Return true if the DDF is padded with circumflexes from POSN.
+
+		Some files are padded at the end with circumflexes. If LENGTH is None,
+		POSN is where a record's leader would start, and a leader never starts
+		with a circumflex. Otherwise, POSN is where a record that is just a
+		field area of LENGTH octets would start (after an "R" record) - that
+		might start with a circumflex, so it must be all circumflexes (up to
+		the end of the file, if that comes first).
+		"""
+
+		file = self.file
+
+		file.seek(posn,SEEK_START)
+
+		if file.read(1) != CIRCUMFLEX:
+			return FALSE
+		elif length == None:
+			return TRUE
+		else:
+			return string.strip(file.read(length-1),CIRCUMFLEX) == ""
+
+
+	def _raw_directories(self):
+		"""Iterate over the data records' directories, reading them from the file.
+
+		This does not make Record (or Leader, Directory, etc.) objects, does
+		not read the records' field areas, and does not change the current
+		record.
+
+		Yields a tuple for each data record (starting with record 1):
+
+			(index,entries,posn,length)
+
+		where "entries" is a list of (tag,posn,length) tuples, one for each
+		entry in the record's directory, and POSN and LENGTH are the
+		position in the file and length of the record's field area. The
+		records after an "R" record all yield the same "entries" list.
+
+		This stops at the end of the file, or at the circumflexes that some
+		files are padded with at the end (see "_padding_at()").
+		"""
+
+		if self.file == None:
+			raise iso8211_file_error,"There is no file open"
+
+		file      = self.file
+		size      = os.fstat(file.fileno())[6]
+		check     = (self.validate != "none")
+		posn      = self.ddr.length
+		index     = 1
+		R_entries = None
+
+		while TRUE:
+			if R_entries == None:
+				# A normal record, with its own leader and directory
+
+				file.seek(posn,SEEK_START)
+
+				leader = file.read(24)
+
+				if len(leader) < 24 or leader[0] == CIRCUMFLEX:
+					return
+
+				length = int(leader[0:5])
+				base   = int(leader[12:17])
+				octets = file.read(base - 24)
+
+				if len(octets) < base - 24:
+					raise EOFError,"Trying to read record %s"%index
+
+				entries = _directory_entries(octets,leader,check)
+
+				yield (index,entries,posn+base,length-base)
+
+				# An "R" record's leader and directory are also used
+				# for all the records that follow it
+
+				if leader[6:7] == "R":
+					R_entries = entries
+					R_length  = length - base
+
+			else:
+				# A record which is just a field area
+
+				if posn >= size or self._padding_at(posn,R_length):
+					return
+
+				length = R_length
+
+				yield (index,R_entries,posn,length)
+
+			posn  = posn + length
+			index = index + 1
+
+
+	def _raw_records(self):
+		"""Iterate over the data records, reading them straight from the file.
+
+		This does not make Record (or Leader, Directory, etc.) objects, and
+		does not change the current record.
+
+		Yields a tuple for each data record (starting with record 1):
+
+			(index,entries,field_area)
+
+		where "entries" is a list of (tag,posn,length) tuples, one for each
+		entry in the record's directory, and "field_area" is the record's
+		field area - so a field's data (including its final FT) is:
+
+			field_area[posn:posn+length]
+		"""
+
+		file = self.file
+
+		for index,entries,posn,length in self._raw_directories():
+			file.seek(posn,SEEK_START)
+
+			field_area = file.read(length)
+
+			if len(field_area) < length:
+				raise EOFError,"Trying to read field area in record %s"%index
+
+			yield (index,entries,field_area)
+
+
+	def intern_values(self,labels,size=10000):
+		"""Share the data of equal subfields with one of the LABELS, when splitting.
+
+		LABELS is a list of subfield labels whose values are expected to
+		come from a small set (codes, flags, object classes, and so on).
+		From now on, when a field is split (by "Field.split()", "visit()",
+		etc.), the data for a subfield with one of those labels is looked
+		up in an Intern_table, shared by the whole DDF, so that equal
+		values are the same string object. This saves memory when a lot
+		of records are kept, and makes comparing them quicker.
+
+		SIZE is the most values the table will hold - once it is full,
+		further new values are not interned. Calling this again adds to
+		the LABELS, but does not change the table.
+
+		This applies to "Field.get()", "Field.unit()" and the decoders
+		from "codegen.decoders()" as well. The field definitions that
+		the DDR has not worked out yet are not made now - each picks up
+		the interning when it is made (see Field_desc_dict).
+		"""
+
+		if self.file == None:
+			raise iso8211_file_error,"There is no file open"
+
+		if self._intern_table == None:
+			self._intern_table  = Intern_table(size)
+			self._intern_labels = {}
+
+		for label in labels:
+			self._intern_labels[label] = TRUE
+
+		self.ddr._interning = (self._intern_labels,self._intern_table)
+
+		# (only the field definitions that have already been made)
+
+		for desc in self.ddr.dict.made():
+			desc._interning = self.ddr._interning
+
+
+	def as_table(self,tags):
+		"""Return a Record_table for the data records with the fields TAGS.
+
+		TAGS is a list of the tags of the fields wanted, in order. The first
+		data record whose directory has exactly those tags decides the layout
+		(the length and position of each field) - every data record with the
+		same layout goes into the table, and the indices of the others are
+		left in the table's "others" list (they can still be read in the
+		normal way, with "record()").
+
+		Only the records' leaders and directories are read to decide this,
+		and the current record is not changed. Returns None if no data
+		record has the fields TAGS.
+		"""
+
+		tags    = tuple(tags)
+		layout  = None
+		starts  = array.array("l")
+		indices = array.array("l")
+		others  = []
+
+		for index,entries,posn,length in self._raw_directories():
+			if layout == None and len(entries) == len(tags) and \
+			   tuple([entry[0] for entry in entries]) == tags:
+				layout = (entries,length)
+
+			if layout != None and length == layout[1] and entries == layout[0]:
+				starts.append(posn)
+				indices.append(index)
+			else:
+				others.append(index)
+
+		if layout == None:
+			return None
+
+		table = Record_table(self,layout[0],layout[1],starts,indices)
+		table.others = others
+
+		return table
+
+
+	def visit(self,on_record=None,on_field=None,on_subfield=None,tags=None):
+		"""Read through the data records, calling the given functions.
+
+		ON_RECORD	if given, is called as ON_RECORD(index) at the start
+				of each data record (the first has index 1)
+		ON_FIELD	if given, is called as ON_FIELD(tag,data) for each
+				field, where DATA is the field's data (without the
+				final FT)
+		ON_SUBFIELD	if given, is called as ON_SUBFIELD(tag,label,value)
+				for each subfield of each field, where LABEL and
+				VALUE are as returned by "Field.split()" (so VALUE
+				is the subfield data - use "parse_item()" to turn
+				it into a value of the appropriate datatype)
+		TAGS		if given, is a list of the tags wanted - fields with
+				any other tag are skipped without being looked at
+
+		The records are read straight from the file, and no Record or Field
+		objects are made, so this is much quicker than iterating over the
+		DDF when the data only needs to be passed on (for instance, when
+		exporting it). Fields are only split into subfields if ON_SUBFIELD
+		is given. The current record is not changed.
+
+		Returns the number of data records visited.
+		"""
+
+		dict  = self.ddr.dict
+		check = (self.validate != "none")
+		count = 0
+
+		if tags != None:
+			wanted = {}
+			for tag in tags:
+				wanted[tag] = TRUE
+
+		for index,entries,field_area in self._raw_records():
+			count = count + 1
+
+			if on_record != None:
+				on_record(index)
+
+			for tag,posn,length in entries:
+				if tags != None and not wanted.has_key(tag):
+					continue
+
+				data = _field_data(field_area,posn,length,tag,index,check)
+
+				if on_field != None:
+					on_field(tag,data)
+
+				if on_subfield != None:
+					for label,control,value in dict[tag].split(data):
+						on_subfield(tag,label,value)
+
+		return count
+
+
+	def events(self,tags=None):
+		"""Return an Event_stream for the data records in this DDF.
+
+		TAGS, if given, is a list of the tags wanted - fields with any other
+		tag are skipped without being looked at.
+
+		This is the `pull' version of "visit()" - see Event_stream for
+		details.
+		"""
+
+		return Event_stream(self,tags)
+
+
+	def R_table(self):
+		"""Return an R_table for the "R" record and the records after it.
+
+		Returns None if there is no "R" record. Only the leaders of the
+		records before the "R" record are read (to find it), and the
+		current record is not changed.
+		"""
+
+		if self.file == None:
+			raise iso8211_file_error,"There is no file open"
+
+		file  = self.file
+		posn  = self.ddr.length
+		index = 1
+
+		while TRUE:
+			file.seek(posn,SEEK_START)
+
+			leader = file.read(24)
+
+			if len(leader) < 24 or leader[0] == CIRCUMFLEX:
+				return None
+
+			length = int(leader[0:5])
+
+			if leader[6:7] == "R":
+				break
+
+			posn  = posn + length
+			index = index + 1
+
+		base   = int(leader[12:17])
+		octets = file.read(base - 24)
+
+		if len(octets) < base - 24:
+			raise EOFError,"Trying to read record %s"%index
+
+		entries = _directory_entries(octets,leader,self.validate != "none")
+
+		return R_table(self,index,posn+base,length-base,entries)
+
+
 	def write_DFD(self,dfd_name,merge=TRUE,title=None,author=None,date=None):
 		"""Write the contents of the current DDR to the specified DFD file.
 
@@ -376,7 +812,32 @@ class DDF:
 
 
 # ----------------------------------------------------------------------
-class Record:
+# A Leader, Directory or Field_area only keeps a weak reference back to the
+# record it belongs to, so that a record and its parts do not form a reference
+# cycle - thus a record (and everything it holds) goes away as soon as nothing
+# else refers to it. Using one after its record has gone raises
+# iso8211_record_error.
+
+def _get_record(self):
+	record = self._record()
+
+	if record == None:
+		raise iso8211_record_error, \
+		      "The record this %s belonged to no longer exists - "\
+		      "keep a reference to the Record while using its parts"%\
+		      self.__class__.__name__
+
+	return record
+
+def _set_record(self,record):
+	self._record = weakref.ref(record)
+
+_weak_record = property(_get_record,_set_record,
+			doc="The record we belong to (weakly referenced)")
+
+
+# ----------------------------------------------------------------------
+class Record(object):
 	"""An ISO 8211 (logical) record.
 
 	For consistency, this class should probably be called "DR"
@@ -416,6 +877,9 @@ class Record:
 	     simple jandling of "R" records.
 	"""
 
+	__slots__ = ("ddf","posn","index","length","leader","directory",
+		     "field_area","__weakref__")
+
 	def __init__(self,ddf,posn,index,reading=TRUE):
 
 		self.ddf   = ddf		# which DDF we're a record of
@@ -436,14 +900,21 @@ class Record:
 			self._read(ddf,posn,index)
 
 
-	def _read(self,ddf,posn,index):
-		"""Read a record's data from disk."""
+	def _read(self,ddf,posn,index,reuse=FALSE):
+		"""Read a record's data from disk.
+
+		If REUSE is true, the leader, directory and field area we already
+		have are re-initialised in place, rather than new ones being made.
+		"""
 
 		# If this is a normal record, read the leader information
 		# Otherwise, use the leader we are given
 
 		if ddf.R_leader == None:
-			self.leader = Leader(self,posn)
+			if reuse:
+				self.leader.__init__(self,posn)
+			else:
+				self.leader = Leader(self,posn)
 		else:
 			self.leader = ddf.R_leader
 			self.leader.record = self	# Don't forget to personalise it
@@ -467,14 +938,20 @@ class Record:
 
 		# Set up the field area
 
-		self.field_area = Field_area(self,posn+self.leader.base_address)
+		if reuse:
+			self.field_area.__init__(self,posn+self.leader.base_address)
+		else:
+			self.field_area = Field_area(self,posn+self.leader.base_address)
 
 		# If this is a normal record, read the directory (which
 		# tells us what is in the field area)
 		# Otherwise, use the directory we are given
 
 		if ddf.R_directory == None:
-			self.directory = Directory(self,posn+24)
+			if reuse:
+				self.directory.__init__(self,posn+24)
+			else:
+				self.directory = Directory(self,posn+24)
 		else:
 			self.directory = ddf.R_directory
 			self.directory.record = self	# Don't forget to personalise it
@@ -490,16 +967,64 @@ class Record:
 			ddf.R_directory = self.directory
 
 
-	def __del__(self):
-		"""Attempt to defeat any circular references we might have."""
+	def _reread(self,posn,index):
+		"""Read the record at POSN, with index INDEX, into this record.
+
+		Used by "DDF.next_record()" when it is given a record to reuse.
+		"""
 
-		#if debugging:
-		#	print "__del__ for",`self`
+		self.posn   = posn
+		self.index  = index
+		self.length = 0
 
-		self.ddf	= None
-		self.leader     = None
-		self.field_area = None
-		self.directory  = None
+		self._read(self.ddf,posn,index,TRUE)
+
+
+	def detach(self):
+		"""Return a copy of this record, with its own leader, directory, etc.
+
+		A record yielded by "DDF.scan()" is read into again for the next
+		record - the copy is not, so it can be kept for as long as wanted.
+		"""
+
+		record = copy.copy(self)
+
+		record.leader     = copy.copy(self.leader)
+		record.directory  = copy.copy(self.directory)
+		record.field_area = copy.copy(self.field_area)
+
+		record.leader.record     = record
+		record.directory.record  = record
+		record.field_area.record = record
+
+		return record
+
+
+	def freeze(self,decoded=FALSE):
+		"""Return a Frozen_record snapshot of this record.
+
+		The snapshot does not refer to the DDF (or to this record), so it can
+		be pickled, or kept after the DDF is closed. If DECODED is true, it
+		also holds the fields' subfields, as given by "Field.decoded()".
+		"""
+
+		fields = []
+		values = []
+
+		for field in self:
+			fields.append((field.tag,field.data))
+
+			if decoded:
+				values.append(tuple([(label,data) for label,control,data
+							   in field.decoded()]))
+
+		if decoded:
+			values = tuple(values)
+		else:
+			values = None
+
+		return Frozen_record(self.index,self.posn,self.leader.leader_id,
+				     tuple(fields),self.ddf.ddr.schema_id(),values)
 
 
 	def __repr__(self):
@@ -532,6 +1057,79 @@ class Record:
 		return self.directory.field(index)
 
 
+	def fields_by_tag(self,tag):
+		"""Return a list of the fields in the record with the given TAG.
+
+		Only those fields are read - the directory is used to find them.
+		"""
+
+		return [self.directory.field(which) for which in self.directory.indices(tag)]
+
+
+	def first(self,tag,default=None):
+		"""Return the first field in the record with the given TAG.
+
+		Returns DEFAULT if there is no such field.
+		"""
+
+		indices = self.directory.indices(tag)
+
+		if indices:
+			return self.directory.field(indices[0])
+		else:
+			return default
+
+
+	def has_tag(self,tag):
+		"""Return true if the record has a field with the given TAG."""
+
+		return len(self.directory.indices(tag)) > 0
+
+
+	def tree(self):
+		"""Return the fields in the record, nested as the DDR's 0..0 field says.
+
+		Returns a list of tuples for the top level fields:
+
+			(field,children)
+
+		where CHILDREN is a list of tuples of the same form, for the fields
+		nested within FIELD. A field is nested within the closest field
+		before it whose tag is one of its ancestors (see "DDR.ancestors()")
+		- if there is none, it is at the top level. So if the DDR has no
+		field tag pairs, all the fields are at the top level.
+
+		For instance, with the field tag pairs 0001:FRID, FRID:ATTF and
+		FRID:FSPT, a record with the fields 0001, FRID, ATTF, ATTF, FSPT
+		gives a single 0001 field, with a single FRID child, which in turn
+		has the ATTF, ATTF and FSPT fields as its children.
+		"""
+
+		ddr   = self.ddf.ddr
+		tags  = self.directory.tags
+		top   = []
+		stack = []	# (tag,children) for each field we are within
+
+		for which in range(len(tags)):
+			tag       = tags[which]
+			ancestors = ddr.ancestors(tag)
+
+			while stack and stack[-1][0] not in ancestors:
+				del stack[-1]
+
+			children = []
+			node     = (self.directory.field(which),children)
+
+			if stack:
+				stack[-1][1].append(node)
+			else:
+				top.append(node)
+
+			stack.append((tag,children))
+
+		return top
+
+
 	def show(self,with_leader=TRUE):
 		"""Print out information about this record.
 
@@ -551,7 +1149,7 @@ class Record:
 
 
 # ----------------------------------------------------------------------
-class Leader:
+class Leader(object):
 	"""An ISO 8211 record's leader.
 
 	Initialisation arguments:
@@ -594,6 +1192,14 @@ class Leader:
 	The other DDR specific leader values are held as characters.
 	"""
 
+	__slots__ = ("_record","posn","octets","record_length","leader_id",
+		     "base_address","sizeof_field_len","sizeof_field_pos",
+		     "sizeof_field_tag","interchange_level",
+		     "inline_code_extension","version_number",
+		     "application_indicator","field_control_length",
+		     "extended_character_set")
+	record = _weak_record
+
 	def __init__(self,record,posn,reading=TRUE):
 		self.record = record	# back-reference
 		self.posn   = posn	# just in case
@@ -638,7 +1244,7 @@ class Leader:
 		# If this is NOT the DDR leader, check that the size of field tag field
 		# gives the same size as in the DDR's leader (5.2.1.5.4, last sentence)
 
-		if self.leader_id != "L":
+		if self.leader_id != "L" and record.ddf.validate == "strict":
 			# Find the DDR (!)
 			ddr = self.record.ddf.ddr
 
@@ -650,15 +1256,6 @@ class Leader:
 				       ddr.leader.sizeof_field_tag)
 
 
-	def __del__(self):
-		"""Attempt to defeat any circular references we might have."""
-
-		#if debugging:
-		#	print "__del__ for",`self`
-
-		self.record = None
-
-
 	def __repr__(self):
 		return "Leader to " + `self.record`
 
@@ -790,7 +1387,7 @@ class Leader:
 
 
 # ----------------------------------------------------------------------
-class Directory:
+class Directory(object):
 	"""An ISO 8211 record's directory
 
 	Initialisation arguments:
@@ -806,6 +1403,16 @@ class Directory:
 
 		entry_size	the size of a field's entry in the directory
 		num_entries	how many directory entries there are
+		num_fields	the same, for data records
+
+		tags		a tuple of the tags in the directory entries
+		positions	an array of the field positions they give
+		lengths		an array of the field lengths they give
+				(including each field's final FT)
+
+		fieldlist	a list of (tag,position,length) tuples, one
+				for each entry - note that "length" does NOT
+				include the final FT here
 
 	And the `private' value:
 
@@ -816,6 +1423,10 @@ class Directory:
 
 	"""
 
+	__slots__ = ("_record","posn","entry_size","_octets","num_entries",
+		     "num_fields","tags","positions","lengths","_tag_index")
+	record = _weak_record
+
 	def __init__(self,record,posn,reading=TRUE):
 		self.record     = record	# back-reference
 		self.posn       = posn		# where we are in the file
@@ -874,15 +1485,16 @@ class Directory:
 		# The last character should be an FT, and it should be
 		# at position (N * entry_size) + 1
 
-		if (directory_length % self.entry_size) != 1:
-			remainder = directory_length%self.entry_size
-			raise iso8211_dir_error,(EXC_DIR_SIZE,
-						 self.entry_size,
-						 directory_length,
-						 self._octets[-remainder])
+		if record.ddf.validate != "none":
+			if (directory_length % self.entry_size) != 1:
+				remainder = directory_length%self.entry_size
+				raise iso8211_dir_error,(EXC_DIR_SIZE,
+							 self.entry_size,
+							 directory_length,
+							 self._octets[-remainder])
 
-		if self._octets[-1] != FT:
-			raise iso8211_dir_error,(EXC_DIR_NOTFT,self._octets[-1])
+			if self._octets[-1] != FT:
+				raise iso8211_dir_error,(EXC_DIR_NOTFT,self._octets[-1])
 		
 		self.num_entries = (directory_length-1) / self.entry_size
 
@@ -893,48 +1505,60 @@ class Directory:
 		# d) that any 0..9 field occurs first in the record
 		# e) that any 0..1 field occurs first in the record (except after a 0..9 field)
 
-		#print "%d entries in the directory:" % self.num_entries
-
-		self.fieldlist = []
-
-		# split out the fields in the field area based on their unit size
-		# TODO: make delimited fields work, too.
-		for index in range(self.num_entries):
-			entr = Directory_entry(self, self.entry(index)) 
-			#print entr
-			self.fieldlist.append((entr.tag, entr.pos, entr.len))
-			#if self.record.index != 0:
-				## fill field list based on provided sizes. Each entry is of the form
-				## (tag, offset, len)
-				#unit_size = self.record.ddf.ddr.dict[entr.tag].format_controls.unit_size
-				#print "  unit size = %d" % unit_size
-				
-				#if unit_size == 0:
-					#print "  fields = 1"
-					#self.fieldlist.append((entr.tag, entr.pos, entr.len))
-				#else:
-					#print "  fields = %d" % (entr.len / unit_size)
-					#for offset in range(0,entr.len, unit_size):
-						#self.fieldlist.append((entr.tag, entr.pos + offset, unit_size))
-
-		self.num_fields = len(self.fieldlist)
+		# Split all the entries out in one go (we've already checked
+		# the directory, if we are going to)
+
+		self.tags,self.positions,self.lengths = \
+			  _directory_columns(self._octets,leader.sizeof_field_tag,
+					     leader.sizeof_field_len,
+					     leader.sizeof_field_pos,FALSE)
+
+		self.num_fields = self.num_entries
+
+		# The directory indices for each tag, once they are asked for
+
+		self._tag_index = None
 
 		if debugging:
 			print "Fieldlist: "
 			for fld in self.fieldlist:
 				print fld
 
-	def __del__(self):
-		"""Attempt to defeat any circular references we might have."""
+	def __repr__(self):
+		return "Directory to " + `self.record`
+
 
-		#if debugging:
-		#	print "__del__ for",`self`
+	def _get_fieldlist(self):
+		lengths = [length - 1 for length in self.lengths]	# without the FT
+		return zip(self.tags,self.positions,lengths)
 
-		self.record = None
+	fieldlist = property(_get_fieldlist,
+			     doc="A list of (tag,position,length-1) for each entry")
 
 
-	def __repr__(self):
-		return "Directory to " + `self.record`
+	def indices(self,tag):
+		"""Return a tuple of the indices of the entries for fields with TAG.
+
+		The first time this is called, a dictionary of the indices for
+		each tag is made from "tags" - after that, it is just looked up.
+		"""
+
+		if self._tag_index == None:
+			index = {}
+
+			for which in range(len(self.tags)):
+				name = self.tags[which]
+				if index.has_key(name):
+					index[name].append(which)
+				else:
+					index[name] = [which]
+
+			for name in index.keys():
+				index[name] = tuple(index[name])
+
+			self._tag_index = index
+
+		return self._tag_index.get(tag,())
 
 
 	def entry(self,index):
@@ -999,7 +1623,7 @@ class Directory_entry(object):
 		return "  Directory entry: %s, len %d, pos %d" % (self.tag, self.len, self.pos)
 	
 # ----------------------------------------------------------------------
-class Field_area:
+class Field_area(object):
 	"""An ISO 8211 record's field area
 
 	Initialisation arguments:
@@ -1021,6 +1645,9 @@ class Field_area:
 
 	"""
 
+	__slots__ = ("_record","posn","length","_octets")
+	record = _weak_record
+
 	def __init__(self,record,posn,reading=TRUE):
 		self.record    = record	# back-reference
 		self.posn      = posn	# our location in the file
@@ -1053,15 +1680,6 @@ class Field_area:
 				raise EOFError,"Trying to read field area in record %s"%record.index
 
 
-	def __del__(self):
-		"""Attempt to defeat any circular references we might have."""
-
-		#if debugging:
-		#	print "__del__ for",`self`
-
-		self.record = None
-
-
 	def __repr__(self):
 		return "Field area in " + `self.record`
 
@@ -1082,6 +1700,95 @@ class Field_area:
 		print "Field area, length %d"%(self.length)
 		print "- show the contents of the field area by showing the directory..."
 
+def _field_data(field_area,posn,length,tag,index,check=TRUE):
+	"""Return a field's data (without its final FT) from a record's FIELD_AREA.
+
+	POSN and LENGTH are from the field's directory entry, and TAG and
+	INDEX (the record's index) are used in the error raised if the data
+	does not end with FT (which is only checked if CHECK is true).
+	"""
+
+	end = posn + length - 1
+
+	if check and (length == 0 or field_area[end:end+1] != FT):
+		raise iso8211_error, \
+		      "Data for field %s in record %s does not end with FT"%(tag,index)
+
+	return field_area[posn:end]
+
+
+def _directory_entries(octets,leader,check=TRUE):
+	"""Return the entries in a record's directory, as (tag,posn,length) tuples.
+
+	OCTETS is the directory (including its final FT), and LEADER is the
+	record's leader (as a string). The directory is only checked if CHECK
+	is true.
+	"""
+
+	splitter = _directory_splitter(octets,int(leader[23:24]),
+				       int(leader[20:21]),int(leader[21:22]),check)
+
+	return [(intern(tag),int(posn),int(length))
+		for tag,length,posn in splitter.findall(octets,0,len(octets)-1)]
+
+
+def _directory_columns(octets,sizeof_tag,sizeof_len,sizeof_pos,check=TRUE):
+	"""Return the entries in a record's directory, as parallel columns.
+
+	OCTETS is the directory (including its final FT), and the sizes are
+	those from the record's leader's entry map. The directory is only
+	checked if CHECK is true. Returns the tuple:
+
+		(tags,positions,lengths)
+
+	where "tags" is a tuple of the tags, and "positions" and "lengths" are
+	arrays of the field positions and lengths (the lengths include each
+	field's final FT). The tags are interned, so each tag is the same
+	string object in every record (and in the DDR).
+	"""
+
+	splitter = _directory_splitter(octets,sizeof_tag,sizeof_len,sizeof_pos,check)
+	entries  = splitter.findall(octets,0,len(octets)-1)
+
+	tags      = tuple([intern(tag) for tag,length,posn in entries])
+	positions = array.array("l",[int(posn) for tag,length,posn in entries])
+	lengths   = array.array("l",[int(length) for tag,length,posn in entries])
+
+	return (tags,positions,lengths)
+
+
+# The compiled expressions used to split directories, by entry map sizes
+
+_directory_splitters = {}
+
+def _directory_splitter(octets,sizeof_tag,sizeof_len,sizeof_pos,check=TRUE):
+	"""Check the directory OCTETS, and return an expression to split it.
+
+	The expression finds each entry in the directory (without its final
+	FT), as a (tag,length,posn) tuple of strings. The expressions are
+	cached, as there are usually only one or two entry maps in a file.
+	The directory is only checked if CHECK is true.
+	"""
+
+	if check:
+		entry_size = sizeof_tag + sizeof_len + sizeof_pos
+
+		if len(octets) % entry_size != 1:
+			raise iso8211_dir_error,(EXC_DIR_SIZE,entry_size,len(octets),octets[-1:])
+
+		if octets[-1] != FT:
+			raise iso8211_dir_error,(EXC_DIR_NOTFT,octets[-1])
+
+	key = (sizeof_tag,sizeof_len,sizeof_pos)
+
+	try:
+		return _directory_splitters[key]
+	except KeyError:
+		splitter = re.compile("(.{%d})(.{%d})(.{%d})"%key,re.DOTALL)
+		_directory_splitters[key] = splitter
+		return splitter
+
+
 def _unsigned_int(msof,data):
 	"""Interpret the octets of DATA as a signed integer in MSOF/LSOF order.
 
@@ -1108,7 +1815,7 @@ def _unsigned_int(msof,data):
 
 
 # ----------------------------------------------------------------------
-class Field:
+class Field(object):
 	"""An ISO 8211 field.
 
 	Used to hold information about an ISO 8211 field
@@ -1134,8 +1841,14 @@ class Field:
 		posn		the position of the field's data in the field area
 		data		the field's data
 
+		values		a Field_values view of the field's (parsed)
+				subfield values
+
 	"""
 
+	__slots__ = ("record","index","tag","length","posn","data",
+		     "_subfields","_parsed")
+
 	def __init__(self,directory,index,reading=TRUE):
 		if index < 0:
 			raise iso8211_index_error(index,"field index must be 0 or more")
@@ -1153,6 +1866,12 @@ class Field:
 		self.record = directory.record	# back reference
 		self.index  = index		# which field we are (0..n)
 
+		# The result of "split()", and the subfield values parsed from it
+		# so far (see "values"), once they are asked for
+
+		self._subfields = None
+		self._parsed    = {}
+
 		# If we are reading, retrieve the data for this field
 
 		if reading:
@@ -1165,24 +1884,11 @@ class Field:
 	def _read_ddr(self,directory,index):
 		"""Retrieve the data for this DDR field from the directory and field area."""
 
-		# Read the directory entry for this field
-		# print "Reading DDR field"
-
-		dir_entry = directory.entry(index)
-
-		# Dissect it
-
-		start    = 0
-		end      = self.record.leader.sizeof_field_tag
-		self.tag = dir_entry[start:end]
+		# Look up the directory entry for this field
 
-		start       = end
-		end         = end + self.record.leader.sizeof_field_len
-		self.length = int(dir_entry[start:end])
-
-		start     = end
-		end       = end + self.record.leader.sizeof_field_pos
-		self.posn = int(dir_entry[start:end])
+		self.tag    = directory.tags[index]
+		self.length = directory.lengths[index]
+		self.posn   = directory.positions[index]
 
 		# And retrieve the field data as well
 
@@ -1201,6 +1907,9 @@ class Field:
 
 		# (Can self.length be zero? - NO, because we need a terminating FT...)
 
+		if self.record.ddf.validate == "none":
+			return
+
 		if self.length == 0 or len(self.data) == 0 or self.data[-1] != FT:
 			raise iso8211_error,\
 			      ("Data for field %s (%s) in record %s does not end with FT\n" \
@@ -1209,18 +1918,12 @@ class Field:
 	def _read_datafield(self,directory,index):
 		"""Retrieve the data for this data field from the directory and field area."""
 
-		# Read the directory entry for this field
-		# print "Reading datafield"
-
-		dir_entry = directory.fieldlist[index]
+		# Look up the directory entry for this field
+		# (our length does not include the final FT)
 
-		# Dissect it
-
-		self.tag = dir_entry[0]
-
-		self.posn = dir_entry[1]
-
-		self.length = dir_entry[2]
+		self.tag    = directory.tags[index]
+		self.posn   = directory.positions[index]
+		self.length = directory.lengths[index] - 1
 
 		# And retrieve the field data as well
 
@@ -1233,140 +1936,130 @@ class Field:
 
 		# print "Tag = %s, Data = %s" % (self.tag, printable(self.data))
 
-	def __del__(self):
-		"""Attempt to defeat any circular references we might have."""
-
-		#if debugging:
-		#	print "__del__ for",`self`
+	def __repr__(self):
+		return "Field "+`self.index`+" in " + `self.record`
 
-		self.record = None
 
+	def __getitem__(self,label):
+		"""Return the data for the subfield with the given (expanded) LABEL.
 
-	def __repr__(self):
-		return "Field "+`self.index`+" in " + `self.record`
+		This is the subfield data that "split()" would return for that
+		label, but without splitting the whole field - see "get()".
 
+		Raises KeyError if there is no such subfield.
+		"""
 
+		field_desc = self.record.ddf.ddr.dict[self.tag]
+		data       = self._data_without_FT()
 
-	def split(self):
-		"""Split this field's data into subfields.
+		if field_desc.array_descriptor == None or field_desc.array_descriptor.variable:
+			# The labels depend upon the data, so we have to split it
 
-		This is done according to the subfield labels (if any) and the
-		format controls (if any - note that the field controls can often
-		provide default format controls if none are explicitly provided).
+			for name,control,item in self.split():
+				if name == label:
+					return item
 
-		Returns a list of tuples:
+			raise KeyError,label
 
-			(subfield label, subfield control, subfield data)
+		return field_desc.find_subfield(data,label)
 
-		where:
-			"subfield label"	is None or the expanded label for this
-						subfield. For a Cartesian label, this is
-						what you might expect. For a fixed array
-						field, this is the appropriate descriptive
-						index - for instance, "2,3".
-			"subfield control"	is None or a Control object, containing the
-						format control for this subfield.
-			"subfield data"		is a string containing the data for this
-						subfield.
 
-		Note that "X" controls are not labelled, and do not contribute to the
-		list, although they do cause data to be skipped.
+	def get(self,label,default=None):
+		"""Return the data for the subfield with the given (expanded) LABEL.
 
-		The routine "parse_item(datatype,data)" (qv) may be used to turn the
-		string into a value of the appropriate datatype.
+		Returns DEFAULT if there is no such subfield.
 
-		Raises iso8211_error if there are no format controls or labels.
+		This is much quicker than searching the list returned by "split()"
+		when only one or two subfields are wanted - fields with fixed width
+		subfields are indexed directly, and other fields are only read as
+		far as the wanted subfield. If a label occurs more than once (as in
+		a table), the first subfield with that label is returned.
 		"""
 
-		# Look up our field's definition in the DDR
+		try:
+			return self[label]
+		except KeyError:
+			return default
 
-		ddr        = self.record.ddf.ddr
-		field_desc = ddr.dict[self.tag]
 
-		# If we don't have any format controls, or any labels, then
-		# we're a bit stumped. We should always have at least some
-		# sort of format control, since the field controls lead to
-		# a default value, and ditto for the array descriptor.
-		# So all one can really do is raise an exception, I guess.
+	def unit_count(self):
+		"""Return the number of repeating units in this field.
 
-		if field_desc.format_controls == None or field_desc.array_descriptor == None:
-			raise iso8211_error, \
-			      "Unable to split data - no format controls or labels\n" \
-			      "Reading data for field %s (%s) in record %s\n"% \
-			      (self.index,self.tag,self.record.index)
+		A unit is one repeat of the field's format controls. This only
+		works for fields whose format controls are all fixed width (for
+		instance, "(2B(32))" for a list of coordinates), and returns None
+		for other fields.
+		"""
 
+		field_desc = self.record.ddf.ddr.dict[self.tag]
 
-		# Lose the final FT from our data
+		return field_desc.unit_count(self._data_without_FT())
 
-		if len(self.data) == 0 or self.data[-1] != FT:
-			raise iso8211_error(
-			      "Data for field %s (%s) in record %s does not end with FT\n" \
-			       "Data is `%s'"%(self.index,self.tag,self.record.index,self.data))
-			#print "Data for field %s (%s) in record %s does not end with FT\n" \
-			#       "Data is `%s'"%(self.index,self.tag,self.record.index,printable(self.data))
-			#data = self.data
-		else:
-			data = self.data[:-1]
 
-		# And process it
+	def unit(self,which):
+		"""Return the subfields in repeating unit WHICH of this field.
 
-		if field_desc.array_descriptor.unlabelled:
-			list = self._split_unlabelled(data)
-		else:
-			list = self._split_labelled(data)
+		WHICH counts from 0 (and may be negative, to count from the end).
+		The unit's position is worked out directly, so the units before it
+		are not read at all - which makes a binary search over sorted units,
+		or paging through a very large field, cheap.
 
-		return list
+		Returns a list of tuples, as for "split()", for the subfields in
+		that unit. Raises ValueError if the field's format controls are not
+		all fixed width, and IndexError if there is no such unit.
+		"""
 
+		field_desc = self.record.ddf.ddr.dict[self.tag]
 
+		return field_desc.unit(self._data_without_FT(),which)
 
-	def _split_unlabelled(self,data):
-		"""Split this unlabelled field's data into subfields.
 
-		Returns a list of tuples:
+	def subfields(self):
+		"""Return the result of "split()", remembering it for next time.
 
-			(None, subfield control, subfield data)
+		The list returned should not be altered.
+		"""
 
-		where:
-			"subfield control"	is None or a Control object, containing the
-						format control for this subfield.
-			"subfield data"		is a string containing the data for this
-						subfield.
+		if self._subfields == None:
+			self._subfields = self.split()
 
-		Note that "X" controls are not labelled, and do not contribute to the
-		list, although they do cause data to be skipped.
+		return self._subfields
+
+
+	def decoded(self):
+		"""Return the result of "split()", with the character data decoded.
+
+		See "Field_desc.decode()" - character subfields are returned as
+		Unicode strings, if the DDR (or DDF) says what character set they
+		are in.
 		"""
 
-		# Look up our field's definition in the DDR
+		return self.record.ddf.ddr.dict[self.tag].decode(self.subfields())
 
-		ddr        = self.record.ddf.ddr
-		field_desc = ddr.dict[self.tag]
 
-		list = []
+	def _get_values(self):
+		return Field_values(self)
 
-		for control in field_desc.format_controls:
-			#print "Format %s"%(control)
+	values = property(_get_values,
+			  doc="A view of the field's subfield values (see Field_values)")
 
-			try:
-				item,data = read_item(data,control)
-			except IndexError:
-				# End of data
-				break
-			except ValueError,why:
-				print "Problem reading data for `%s' (%s):\n"\
-				      "        %s"%(self.tag,control,why)
-				return list
 
-			list.append((None,control,item))
+	def _data_without_FT(self):
+		"""Return our data, without the final FT."""
 
-			if len(data) == 0:
-				break
+		if len(self.data) > 0 and self.data[-1] == FT:
+			return self.data[:-1]
+		else:
+			return self.data
 
-		return list
 
 
+	def split(self):
+		"""Split this field's data into subfields.
 
-	def _split_labelled(self,data):
-		"""Split this labelled field's data into subfields.
+		This is done according to the subfield labels (if any) and the
+		format controls (if any - note that the field controls can often
+		provide default format controls if none are explicitly provided).
 
 		Returns a list of tuples:
 
@@ -1381,93 +2074,54 @@ class Field:
 			"subfield control"	is None or a Control object, containing the
 						format control for this subfield.
 			"subfield data"		is a string containing the data for this
-						subfield.
+						subfield (or an integer, for a "B(size)"
+						bit field that is not a whole number
+						of octets).
 
 		Note that "X" controls are not labelled, and do not contribute to the
 		list, although they do cause data to be skipped.
+
+		The routine "parse_item(datatype,data)" (qv) may be used to turn the
+		string into a value of the appropriate datatype.
+
+		Raises iso8211_error if there are no format controls or labels.
 		"""
 
 		# Look up our field's definition in the DDR
 
 		ddr        = self.record.ddf.ddr
 		field_desc = ddr.dict[self.tag]
-		format     = field_desc.format_controls
-		labels     = field_desc.array_descriptor
-
-		list = []
 
-		if labels.variable:
-			# Work out the expanded labels for this variable array
-			labels_iter,data = self._find_var_labels(data)
-		else:
-			# We can just iterate over the array descriptor itself
-			labels_iter = labels
-
-		# Iterate throught the labels
-
-		format.rewind()		# just in case (shouldn't be needed)
-		for label in labels_iter:
-			# Get the format control for this item
-
-			control = format.next_item()
-
-			# "X" items are simply ignored - they are not labelled
-
-			while control.control == "X":
-				item,data = read_item(data,control)
-				control   = format.next_item()
-				#print "Ignoring `X' item:",
-				#print item
-
-			#print "Label %s, format %s"%(label,control)
-
-			try:
-				item,data = read_item(data,control)
-			except IndexError:
-				# End of data
-				return list
-			except ValueError,why:
-				print "Problem reading data for `%s' (subfield %s, %s):\n"\
-				      "        %s\n" \
-				      "        Unread data: `%s'"% \
-				      (self.tag,label,control,why,printable(data))
-				return list
-
-			list.append((label,control,item))
-
-		return list
-
-
-	def _find_var_labels(self,data):
-		"""Work out the expanded labels for a variable array field.
-
-		Returns the tuple:
-
-			(labels,data)
-
-		where "labels" is the expanded labels list, and
-		      "data"   is what is left of the field's data
-		"""
-
-		# The array dimensions are in the data
-		# Create a format control to read a UT delimited integer
-
-		control = __.format.Control("I",None,None)
+		# If we don't have any format controls, or any labels, then
+		# we're a bit stumped. We should always have at least some
+		# sort of format control, since the field controls lead to
+		# a default value, and ditto for the array descriptor.
+		# So all one can really do is raise an exception, I guess.
 
-		# The first integer is the dimensionality
+		if field_desc.format_controls == None or field_desc.array_descriptor == None:
+			raise iso8211_error, \
+			      "Unable to split data - no format controls or labels\n" \
+			      "Reading data for field %s (%s) in record %s\n"% \
+			      (self.index,self.tag,self.record.index)
 
-		dimension,data = read_and_parse_item(data,control)
 
-		# Followed by that number of extents
+		# Lose the final FT from our data
 
-		extents = []
-		for count in range(dimension):
-			extent,data = read_and_parse_item(data,control)
-			extents.append(extent)
+		if ddr.ddf.validate == "none":
+			data = self.data[:-1]
+		elif len(self.data) == 0 or self.data[-1] != FT:
+			raise iso8211_error(
+			      "Data for field %s (%s) in record %s does not end with FT\n" \
+			       "Data is `%s'"%(self.index,self.tag,self.record.index,self.data))
+			#print "Data for field %s (%s) in record %s does not end with FT\n" \
+			#       "Data is `%s'"%(self.index,self.tag,self.record.index,printable(self.data))
+			#data = self.data
+		else:
+			data = self.data[:-1]
 
-		# So create a list of label names from those extents
+		# And split the data according to our field description
 
-		return expand_labels_num(extents),data
+		return field_desc.split(data)
 
 
 	def show(self):
@@ -1482,8 +2136,10 @@ class Field:
 
 		# Split the data up into subfields
 
+		values = self.values
+
 		try:
-			list = self.split()
+			list = self.subfields()
 		except iso8211_error,what:
 			print "%s: %s"%(iso8211_error,what)
 			print "        data =",`printable(self.data[:-1])` # absent the final FT
@@ -1526,7 +2182,7 @@ class Field:
 				print "%s %s" % (_unsigned_int(FALSE, value[0]), _unsigned_int(FALSE, value[1:]))
 			else:
 				try:
-					value = parse_item(control.control,value)
+					value = values[count-1]
 				except ValueError,what:
 					print "%s: %s"%(ValueError,what)
 					continue
@@ -1535,152 +2191,1244 @@ class Field:
 					print `printable(value)`
 				else:
 					print `value`
+
 
 # ----------------------------------------------------------------------
-class DDR(Record):
-	"""An ISO 8211 DDR (data definition record).
-
-	This is a sub-class of the DR class, `Record'.
+class Field_values(object):
+	"""A view of the subfield values of a field.
 
 	Initialisation arguments:
 
-		ddf		the DDF we are in
-		reading		are we reading, rather than writing
-				(defaults to TRUE)
+		field		the Field whose values we are
 
-	A DDR object contains (as well as its Record data):
+	The field's data is only split into subfields when a value is first
+	asked for, and each value is only parsed (with "parse_item") when it
+	is first asked for. Both are remembered by the field itself, so that
+	asking again (even with a new view) does not repeat the work.
 
-		dict			a dictionary of {field tag :: field definition}
-					derived from the DDR
+	Values may be looked up by position:
 
-		list			a list of field tags, in the order they occur
-					in the DDR
+		field.values[0]
 
-		parents			a dictionary of {field tag :: parent field tag}
-					derived from the information in field 0..0 (if present)
-		child_list		a list of the child tags, in the order they occur
-					witrhin field 0..0
+	or by (expanded) label, in which case the first subfield with that
+	label is used:
+
+		field.values["OBJL"]
+		field.values.get("OBJL",default)
+
+	Iterating over the view gives each value in turn, and "labels()" and
+	"items()" give the subfield labels and (label,value) tuples.
+
+	Raises ValueError if a value cannot be parsed (it is the subfield data
+	that is not acceptable, so this happens when that value is asked for).
 	"""
 
-	def __init__(self,ddf,reading=TRUE):
+	__slots__ = ("field",)
 
-		# Perform the "record" initialisation
-		# - the DDR is the zeroth record, which starts at the start of the file
+	def __init__(self,field):
+		self.field = field
 
-		Record.__init__(self,ddf,0,0,reading)
 
-		# So far we know nothing about field tag pairs
+	def __repr__(self):
+		return "Values of "+`self.field`
 
-		self.parents    = {}
-		self.child_list = []
 
-		# The main thing special about a DDR is its fields - we keep a
-		# dictionary of field definitions, and a list of the tags in the
-		# order they occur.
+	def __len__(self):
+		return len(self.field.subfields())
 
-		self.dict = {}
-		self.list = []
 
-		if reading:
-			self._populate_innards()
+	def __getitem__(self,which):
+		"""Return the value with index WHICH, or the first labelled WHICH."""
 
+		subfields = self.field.subfields()
 
-	def _populate_innards(self):
-		"""Populate our innards from the data read elsewhere."""
+		if type(which) == type(""):
+			which = self.position(which)
+		elif which < 0:
+			which = which + len(subfields)
 
-		# Populate the dictionary of field definitions, and the list of
-		# tags (ordered according to the order they came in)
+		if which < 0 or which >= len(subfields):
+			raise IndexError,"Index should be 0 through %d, not %d"%(len(subfields)-1,which)
 
-		for field in self:
-			tag  = field.tag
-			data = field.data
+		parsed = self.field._parsed
 
-			size = self.leader.sizeof_field_tag
+		try:
+			return parsed[which]
+		except KeyError:
+			pass
 
-			# Some tags are special
+		label,control,item = subfields[which]
 
-			if tag == nought_tag(size,0):
-				# File control field
-				self.dict[tag] = Field_desc_00(self,tag,data)
+		value = parse_item(control.control,item)
+		parsed[which] = value
 
-			elif tag == nought_tag(size,1):
-				# Record identifier field
-				self.dict[tag] = Field_desc_01(self,tag,data)
+		return value
 
-			elif tag == nought_tag(size,2):
-				# User application field
-				self.dict[tag] = Field_desc_02(self,tag,data)
 
-			elif tag == nought_tag(size,3):
-				# Announcer sequence/feature identifier field
-				self.dict[tag] = Field_desc_03(self,tag,data)
+	def __iter__(self):
+		for which in xrange(len(self)):
+			yield self[which]
 
-			elif tag == nought_tag(size,9):
-				# Recursive tree LINKS field
-				self.dict[tag] = Field_desc_09(self,tag,data)
 
-			elif is_nought_tag(tag):	# Any other 0..<digit>
+	def position(self,label):
+		"""Return the index of the first subfield labelled LABEL.
 
-				print "Warning: tag `%s' is a RESERVED tag - it should not be used"%tag
+		Raises KeyError if there is no such subfield.
+		"""
 
-				# But be friendly and use it anyway
+		subfields = self.field.subfields()
 
-				self.dict[tag] = Field_desc(self,tag,data)
+		for which in xrange(len(subfields)):
+			if subfields[which][0] == label:
+				return which
 
-			else:
-				# Any normal field
+		raise KeyError,label
 
-				self.dict[tag] = Field_desc(self,tag,data)
 
-			self.list.append(tag)
+	def get(self,label,default=None):
+		"""Return the value of the first subfield labelled LABEL (or DEFAULT)."""
 
-		# Since this is a DDR, we should then really check that:
-		# a) there is a 0..0 field
-		# b) if this is a version 0 file, there is a 0..1 field (it was compulsory)
-		# c) that there are no 0..4 through 0..8 fields (they're not used)
-		# d) any 0..x tags that are there occur first and in ascending order
+		try:
+			return self[label]
+		except KeyError:
+			return default
 
-	def __del__(self):
-		"""Attempt to defeat any circular references we might have."""
 
-		#if debugging:
-		#	print "__del__ for",`self`
+	def labels(self):
+		"""Return a list of the subfield labels (None for unlabelled subfields)."""
 
-		self.record = None
+		return [subfield[0] for subfield in self.field.subfields()]
 
 
-	def __repr__(self):
-		return "Data descriptive record"
+	def items(self):
+		"""Return a list of (label,value) tuples, one for each subfield."""
 
+		subfields = self.field.subfields()
 
-	def write_DFD(self,dfd,merge=TRUE):
-		"""Write out the appropriate DFD data for this DDF.
+		return [(subfields[which][0],self[which]) for which in xrange(len(subfields))]
 
-		MERGE is TRUE if want to intertwine labels and formats when possible,
-		and FALSE if we never want to.
-		"""
+
+# ----------------------------------------------------------------------
+class Frozen_record(object):
+	"""An immutable snapshot of a data record, as returned by "Record.freeze()".
 
-		self.leader.write_DFD(dfd)
+	Initialisation arguments:
 
-		dfd.write("\n")
+		index		the index of the record in its DDF
+		posn		the seek offset of the record in its DDF
+		leader_id	the record's leader identifier ("D" or "R")
+		fields		a tuple of (tag,data) tuples, one for each field in
+				the record, in order - DATA is as in "Field.data"
+		schema_id	the "DDR.schema_id()" of the DDF's DDR
+		decoded		None, or a tuple with an entry for each field, which
+				is a tuple of (label,data) tuples for its subfields,
+				as returned by "Field.decoded()" (without the controls)
 
-		for tag in self.list:
-			self.dict[tag].write_DFD(dfd,merge)
+	A Frozen_record contains the same things, which cannot be changed.
 
+	It refers to nothing else - in particular, not to the DDF or its DDR
+	(just to the DDR's "schema id") - so it can be pickled, passed to another
+	process, or kept after the DDF has been closed. When it is pickled, only
+	the values above are stored.
 
-	def show(self,with_leader=TRUE):
-		"""Print out the contents of this DDR."""
+	It is possible to iterate over the (tag,data) tuples for the fields:
 
-		print "Data description record (record 0 at offset 0)"
+		for tag,data in frozen:
+			print tag,`data`
+	"""
 
-		if with_leader:
-			self.leader.show()
+	__slots__ = ("index","posn","leader_id","fields","schema_id","decoded")
 
-		print "    Field tag dictionary:"
+	def __init__(self,index,posn,leader_id,fields,schema_id,decoded=None):
+		set = object.__setattr__
 
-		if len(self.list) == 0:
-			print "        Empty"
-		else:
-			for tag in self.list:
-				self.dict[tag].show()
+		set(self,"index",index)
+		set(self,"posn",posn)
+		set(self,"leader_id",leader_id)
+		set(self,"fields",fields)
+		set(self,"schema_id",schema_id)
+		set(self,"decoded",decoded)
+
+
+	def __setattr__(self,name,value):
+		raise AttributeError,"Frozen_record is immutable"
+
+	def __delattr__(self,name):
+		raise AttributeError,"Frozen_record is immutable"
+
+
+	def __reduce__(self):
+		return (Frozen_record,(self.index,self.posn,self.leader_id,
+				       self.fields,self.schema_id,self.decoded))
+
+
+	def __repr__(self):
+		return "Frozen record %d (%d fields)"%(self.index,len(self.fields))
+
+
+	def __eq__(self,other):
+		return isinstance(other,Frozen_record) and \
+		       self.__reduce__()[1] == other.__reduce__()[1]
+
+	def __ne__(self,other):
+		return not self.__eq__(other)
+
+	def __hash__(self):
+		return hash(self.__reduce__()[1])
+
+
+	def __len__(self):
+		return len(self.fields)
+
+
+	def __getitem__(self,which):
+		"""Return the (tag,data) tuple for the WHICH'th field."""
+
+		return self.fields[which]
+
+
+	def fields_by_tag(self,tag):
+		"""Return a list of the data of the fields with the given TAG."""
+
+		return [data for field_tag,data in self.fields if field_tag == tag]
+
+
+	def first(self,tag,default=None):
+		"""Return the data of the first field with the given TAG.
+
+		Returns DEFAULT if there is no such field.
+		"""
+
+		for field_tag,data in self.fields:
+			if field_tag == tag:
+				return data
+
+		return default
+
+
+	def has_tag(self,tag):
+		"""Return true if there is a field with the given TAG."""
+
+		for field_tag,data in self.fields:
+			if field_tag == tag:
+				return TRUE
+
+		return FALSE
+
+
+# ----------------------------------------------------------------------
+# The events produced by an Event_stream
+
+START_RECORD	= "START_RECORD"
+FIELD		= "FIELD"
+SUBFIELD	= "SUBFIELD"
+END_RECORD	= "END_RECORD"
+
+class Event_stream:
+	"""A stream of events describing the data records in a DDF.
+
+	Initialisation arguments:
+
+		ddf		the DDF to read
+		tags		if given, a list of the tags wanted - fields with
+				any other tag are skipped without being looked at
+
+	An Event_stream is an iterator, which reads the data records in the
+	same way as "DDF.visit()" (that is, without making Record or Field
+	objects), and returns one of the following tuples at a time:
+
+		(START_RECORD,index)	at the start of each data record
+		(FIELD,tag)		for each field in the record
+		(SUBFIELD,label,data)	for each subfield in the field, where
+					LABEL and DATA are as returned by
+					"Field.split()"
+		(END_RECORD,index)	at the end of each data record
+
+	For instance:
+
+		events = ddf.events()
+
+		for event in events:
+			if event[0] == iso8211.FIELD and event[1] != "ATTF":
+				events.skip_field()
+
+	After a FIELD event, calling "skip_field()" means that there will be
+	no SUBFIELD events for it - its data is not split. Calling
+	"skip_record()" means that the next event will be the END_RECORD for
+	the current record. Only one record is held at a time, so a whole
+	file can be read this way without its size mattering.
+	"""
+
+	def __init__(self,ddf,tags=None):
+
+		self.ddf  = ddf
+		self.tags = None
+
+		if tags != None:
+			self.tags = {}
+			for tag in tags:
+				self.tags[tag] = TRUE
+
+		self._skip_field  = FALSE
+		self._skip_record = FALSE
+		self._events      = self._generate()
+
+
+	def __repr__(self):
+		return "Event stream for "+`self.ddf`
+
+
+	def __iter__(self):
+		return self
+
+
+	def next(self):
+		"""Return the next event (raises StopIteration at the end of the DDF)."""
+
+		return self._events.next()
+
+
+	def skip_field(self):
+		"""Skip the rest of the current field."""
+
+		self._skip_field = TRUE
+
+
+	def skip_record(self):
+		"""Skip the rest of the current record."""
+
+		self._skip_record = TRUE
+
+
+	def _generate(self):
+		"""Generate the events themselves."""
+
+		dict  = self.ddf.ddr.dict
+		check = (self.ddf.validate != "none")
+
+		for index,entries,field_area in self.ddf._raw_records():
+			self._skip_record = FALSE
+
+			yield (START_RECORD,index)
+
+			for tag,posn,length in entries:
+				if self._skip_record:
+					break
+
+				if self.tags != None and not self.tags.has_key(tag):
+					continue
+
+				self._skip_field = FALSE
+
+				yield (FIELD,tag)
+
+				if self._skip_field or self._skip_record:
+					continue
+
+				data = _field_data(field_area,posn,length,tag,index,check)
+
+				for label,control,item in dict[tag].split(data):
+					yield (SUBFIELD,label,item)
+
+					if self._skip_field or self._skip_record:
+						break
+
+			yield (END_RECORD,index)
+
+
+
+# ----------------------------------------------------------------------
+class Record_table:
+	"""A set of data records with the same layout, as a table.
+
+	Initialisation arguments:
+
+		ddf		the DDF the records are in
+		entries		the (tag,posn,length) entries from the records'
+				directory (which is the same for all of them)
+		record_length	the length of each record's field area
+		starts		the position in the file of each record's
+				field area
+		indices		the index of each record
+
+	Since the records all have the same directory, a given field is
+	always at the same place in each field area, so rather than making a
+	Record (with a Leader, Directory, etc.) for each, a Record_table reads
+	straight from the file (which is memory mapped, if possible).
+
+	A Record_table contains:
+
+		ddf		the associated DDF
+		count		the number of records in the table
+		tags		the tags of the fields in each record, in
+				directory order
+		entries		the directory entries, as (tag,posn,length)
+		record_length	the length of each record's field area
+		indices		the index of each record in the table
+		others		the indices of any records left out of the table
+				(see "DDF.as_table()")
+
+	It is possible to index (and iterate over) the records in the table:
+
+		table = ddf.as_table(["0001","ATTP"])
+
+		for fields in table:
+			print fields[1]
+
+	Each record is returned as a tuple of the data for its fields (as
+	strings, without the final FT), so the data for field J of record I
+	is just table[I][J]. "column()" returns the data for a given field in
+	every record, and if numpy is available "array()" returns the whole
+	table as a numpy structured array.
+	"""
+
+	def __init__(self,ddf,entries,record_length,starts,indices):
+
+		self.ddf           = ddf
+		self.record_length = record_length
+		self.entries       = tuple(entries)
+		self.tags          = tuple([tag for tag,where,length in entries])
+		self.starts        = starts
+		self.indices       = indices
+		self.count         = len(starts)
+		self.others        = []
+
+		self._plan_rows()
+		self._check = (ddf.validate != "none")
+
+		self._octets = _map_file(ddf.file)
+
+
+	def _plan_rows(self):
+		"""Work out a struct to unpack a whole record at once.
+
+		The fields are unpacked in the order they occur, each followed
+		by its FT, and then put back into directory order.
+		"""
+
+		order = []
+
+		for which in range(len(self.entries)):
+			tag,where,length = self.entries[which]
+
+			if length == 0 or where + length > self.record_length:
+				raise iso8211_error,"Field %s in %s does not fit"%(tag,`self`)
+
+			order.append((where,which))
+
+		order.sort()
+
+		codes = []
+		at    = 0
+
+		for where,which in order:
+			tag,where,length = self.entries[which]
+
+			if where < at:
+				raise iso8211_error,"Field %s in %s overlaps another"%(tag,`self`)
+			elif where > at:
+				codes.append("%dx"%(where-at))
+
+			codes.append("%dsc"%(length-1))
+			at = where + length
+
+		self._unpacker = struct.Struct("="+string.join(codes,""))
+		self._order    = tuple([which for where,which in order])
+		self._in_order = (self._order == tuple(range(len(self.entries))))
+
+
+	def __repr__(self):
+		return "Table of %d records in %s"%(self.count,`self.ddf`)
+
+
+	def __len__(self):
+		return self.count
+
+
+	def __getitem__(self,which):
+		"""Return the field data for record WHICH in the table, as a tuple."""
+
+		if which < 0:
+			which = which + self.count
+
+		if which < 0 or which >= self.count:
+			raise IndexError,which
+
+		octets = self._unpacker.unpack_from(self._octets,self._start(which))
+		fields = octets[0::2]
+
+		if self._check and octets[1::2].count(FT) != len(fields):
+			raise iso8211_error, \
+			      "Data for a field in record %s does not end with FT"%self._index(which)
+
+		if self._in_order:
+			return fields
+
+		result = [None] * len(fields)
+
+		for which in range(len(fields)):
+			result[self._order[which]] = fields[which]
+
+		return tuple(result)
+
+
+	def _start(self,which):
+		"""Return the position of record WHICH's field area in the file."""
+
+		return self.starts[which]
+
+
+	def _index(self,which):
+		"""Return the index (in the DDF) of record WHICH."""
+
+		return self.indices[which]
+
+
+	def _field_starts(self,where):
+		"""Return the positions in the file of the field at WHERE in each record."""
+
+		return [start + where for start in self.starts]
+
+
+	def column(self,tag):
+		"""Return a list of the data for field TAG in each record.
+
+		If TAG occurs more than once in the directory, the first is used.
+		Raises KeyError if it does not occur at all.
+		"""
+
+		if tag not in self.tags:
+			raise KeyError,tag
+
+		tag,where,length = self.entries[self.tags.index(tag)]
+
+		octets = self._octets
+		starts = self._field_starts(where)
+		length = length - 1
+
+		if self._check:
+			for which in xrange(len(starts)):
+				if octets[starts[which]+length] != FT:
+					raise iso8211_error, \
+					      "Data for field %s in record %s does not end with FT"%\
+					      (tag,self._index(which))
+
+		return [octets[at:at+length] for at in starts]
+
+
+	def dtype(self,subfields=FALSE):
+		"""Return the numpy dtype for a record in the table.
+
+		There is a member for each field, named by its tag, holding the
+		field's data (without the final FT).
+
+		If SUBFIELDS is true, then each field whose format is "fixed" (and
+		fits its data exactly) is instead given a member for each (labelled)
+		subfield - so the data for subfield K of field J in record I is just
+		array[I][J][K]. Binary forms ("b14", "B24", etc.) are given the
+		appropriate numpy integer or float type.
+
+		Raises iso8211_error if numpy is not available.
+		"""
+
+		if numpy == None:
+			raise iso8211_error,"Record tables need numpy for this"
+
+		names   = []
+		formats = []
+		offsets = []
+
+		for tag,where,length in self.entries:
+			desc = self.ddf.ddr.dict.get(tag)
+
+			names.append(_unique_name(tag,names))
+			formats.append(_numpy_field_format(desc,length-1,subfields))
+			offsets.append(where)
+
+		return numpy.dtype({"names"    : names,
+				    "formats"  : formats,
+				    "offsets"  : offsets,
+				    "itemsize" : self.record_length})
+
+
+	def array(self,subfields=FALSE):
+		"""Return the table as a numpy structured array (see "dtype()").
+
+		The records are copied into the array a run at a time - each run
+		of records which are evenly spaced in the file (as records with the
+		same layout that follow one another are) is copied in one go.
+
+		Raises iso8211_error if numpy is not available.
+		"""
+
+		dtype  = self.dtype(subfields)
+		result = numpy.empty(self.count,dtype)
+		starts = self.starts
+		first  = 0
+
+		while first < self.count:
+			last = first + 1
+			step = self.record_length
+
+			if last < self.count:
+				step = starts[last] - starts[first]
+
+			while last < self.count and starts[last] - starts[last-1] == step:
+				last = last + 1
+
+			result[first:last] = numpy.ndarray((last-first,),dtype,self._octets,
+							   starts[first],(step,))
+			first = last
+
+		return result
+
+
+	def close(self):
+		"""Let go of the file's data (the table cannot be used afterwards)."""
+
+		if isinstance(self._octets,mmap.mmap):
+			self._octets.close()
+
+		self._octets = ""
+		self.count   = 0
+
+
+
+# ----------------------------------------------------------------------
+class R_table(Record_table):
+	"""The records from an "R" record onwards, as a table.
+
+	Initialisation arguments:
+
+		ddf		the DDF the records are in
+		index		the index of the "R" record
+		posn		the position of its field area in the file
+		record_length	the length of each record's field area
+		entries		the (tag,posn,length) entries from its directory
+
+	The records after an "R" record are just field areas, laid out by
+	the "R" record's directory, so they follow one another in the file
+	at regular intervals. An R_table is a Record_table for the "R"
+	record and all the records after it, which also contains:
+
+		index		the index of the "R" record
+		posn		the position of its field area in the file
+
+	and whose "array()" is made straight over the file's data, without
+	copying it (and so is read only).
+	"""
+
+	def __init__(self,ddf,index,posn,record_length,entries):
+
+		self.ddf           = ddf
+		self.index         = index
+		self.posn          = posn
+		self.record_length = record_length
+		self.entries       = tuple(entries)
+		self.tags          = tuple([tag for tag,where,length in entries])
+		self.others        = []
+
+		self._plan_rows()
+		self._check = (ddf.validate != "none")
+
+		# And find out how many records there are
+
+		self._octets = _map_file(ddf.file)
+
+		if record_length == 0:
+			self.count = 0
+		else:
+			self.count = (len(self._octets) - posn) / record_length
+
+			# (not counting any circumflex padding at the end of the file)
+
+			while self.count > 0 and \
+			      ddf._padding_at(self._start(self.count-1),record_length):
+				self.count = self.count - 1
+
+		self.starts  = xrange(posn,posn+self.count*record_length,record_length)
+		self.indices = xrange(index,index+self.count)
+
+
+	def __repr__(self):
+		return "R table of %d records in %s"%(self.count,`self.ddf`)
+
+
+	def _start(self,which):
+		return self.posn + which*self.record_length
+
+
+	def _index(self,which):
+		return self.index + which
+
+
+	def _field_starts(self,where):
+		return xrange(self.posn + where,
+			      self.posn + where + self.count*self.record_length,
+			      self.record_length)
+
+
+	def array(self,subfields=FALSE):
+		"""Return the table as a numpy structured array (see "dtype()").
+
+		The array is made straight over the file's data (it is not copied),
+		and so is read only.
+		"""
+
+		return numpy.frombuffer(self._octets,self.dtype(subfields),
+					self.count,self.posn)
+
+
+def _map_file(file):
+	"""Return the contents of FILE (memory mapped, if we can)."""
+
+	try:
+		return mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+	except (EnvironmentError,ValueError):
+		file.seek(0,SEEK_START)
+		return file.read()
+
+
+def _unique_name(name,names):
+	"""Return NAME, or a variant of it if it is already in NAMES."""
+
+	result = name
+	count  = 1
+
+	while result in names:
+		count  = count + 1
+		result = "%s_%d"%(name,count)
+
+	return result
+
+
+def _numpy_field_format(desc,length,subfields):
+	"""Return the numpy format for a field of LENGTH octets described by DESC.
+
+	If SUBFIELDS is true, and the field's format is "fixed" and fits its
+	data exactly, then this is a structure with a member for each of the
+	(labelled) subfields. Otherwise, it is just the field's octets.
+	"""
+
+	format = None
+
+	if desc != None:
+		format = desc.format_controls
+
+	if subfields and format != None and desc.array_descriptor != None and \
+	   not desc.array_descriptor.variable:
+		plan = format.fixed_struct(length)
+	else:
+		plan = None
+
+	if plan == None:
+		if format != None and format.count > 0:
+			for control in format.walk():
+				if control.control[0] == "B" or control.control[0] == "b":
+					return "V%d"%length
+
+		return "S%d"%length
+
+	controls = plan[1]
+	labels   = desc.label_list(len(controls))
+	names    = []
+	formats  = []
+	offsets  = []
+	at       = 0
+	label    = 0
+
+	for control in controls:
+		where = at
+		at    = at + control.byte_width
+
+		if labels != None:
+			if control.control == "X":
+				continue
+			if label >= len(labels):
+				break
+			name  = labels[label]
+			label = label + 1
+		else:
+			name = "f%d"%len(names)
+
+		names.append(_unique_name(name,names))
+		formats.append(_numpy_format(control))
+		offsets.append(where)
+
+	return numpy.dtype({"names"    : names,
+			    "formats"  : formats,
+			    "offsets"  : offsets,
+			    "itemsize" : length})
+
+
+def _numpy_format(control):
+	"""Return the numpy format for a subfield with the given (fixed) CONTROL."""
+
+	width = control.byte_width
+
+	if control.form == "B":
+		if control.control[0] == "b":
+			order = "<"
+		else:
+			order = ">"
+
+		type = control.control[1]
+
+		if (type == "1" or type == "2") and width in (1,2,4,8):
+			return "%s%s%d"%(order,{"1":"u","2":"i"}[type],width)
+		elif type == "4":
+			return "%sf%d"%(order,width)
+		else:
+			return "V%d"%width
+
+	elif control.control == "B":
+		return "V%d"%width
+	else:
+		return "S%d"%width
+
+
+
+# ----------------------------------------------------------------------
+# The Field_desc classes for the special 0..<digit> tags, for each size of tag
+# (the reserved 0..<digit> tags map to None)
+
+_special_tag_tables = {}
+
+def _special_tags(size):
+	"""Return a dictionary of {0..<digit> tag :: Field_desc class} for tags of SIZE."""
+
+	try:
+		return _special_tag_tables[size]
+	except KeyError:
+		pass
+
+	table = {}
+
+	for digit in string.digits:
+		table[nought_tag(size,digit)] = None
+
+	table[nought_tag(size,0)] = Field_desc_00	# File control field
+	table[nought_tag(size,1)] = Field_desc_01	# Record identifier field
+	table[nought_tag(size,2)] = Field_desc_02	# User application field
+	table[nought_tag(size,3)] = Field_desc_03	# Announcer sequence/feature identifier field
+	table[nought_tag(size,9)] = Field_desc_09	# Recursive tree LINKS field
+
+	_special_tag_tables[size] = table
+
+	return table
+
+
+# ----------------------------------------------------------------------
+class Field_desc_dict(UserDict.DictMixin):
+	"""A dictionary of {field tag :: field definition}, made as they are wanted.
+
+	Initialisation arguments:
+
+		ddr		the DDR the field definitions are for
+
+	The DDR gives each tag's data descriptive field to "add()", and the
+	Field_desc for it is only made when the tag is first looked up (or
+	when something is done that needs all of them, such as "values()",
+	"items()" or "copy()"). So a program that only looks at a few tags
+	doesn't pay for parsing the field controls, array descriptors and
+	format controls of all the others.
+
+	Otherwise, this behaves like an ordinary dictionary (with all the tags
+	in it) - "copy()" returns an ordinary dictionary, as does "dict()" of it.
+	"""
+
+	def __init__(self,ddr):
+		self.ddr      = ddr
+		self._made    = {}	# {tag :: Field_desc}
+		self._pending = {}	# {tag :: (Field_desc class,octets)}
+
+
+	def add(self,tag,desc_class,octets):
+		"""Remember the data descriptive field OCTETS for TAG.
+
+		DESC_CLASS is the Field_desc class to make for it, when it is wanted.
+		"""
+
+		if self._made.has_key(tag):
+			del self._made[tag]
+
+		self._pending[tag] = (desc_class,octets)
+
+
+	def made(self):
+		"""Return a list of the field definitions that have been made so far."""
+
+		return self._made.values()
+
+
+	def __getitem__(self,tag):
+		try:
+			return self._made[tag]
+		except KeyError:
+			pass
+
+		desc_class,octets = self._pending.pop(tag)
+
+		desc = desc_class(self.ddr,tag,octets)
+		desc._interning = self.ddr._interning
+
+		self._made[tag] = desc
+
+		return desc
+
+
+	def __setitem__(self,tag,desc):
+		self._made[tag] = desc
+
+		if self._pending.has_key(tag):
+			del self._pending[tag]
+
+	def __delitem__(self,tag):
+		if self._pending.has_key(tag):
+			del self._pending[tag]
+		else:
+			del self._made[tag]
+
+
+	def keys(self):
+		return self._made.keys() + self._pending.keys()
+
+	def __len__(self):
+		return len(self._made) + len(self._pending)
+
+	def __contains__(self,tag):
+		return self._made.has_key(tag) or self._pending.has_key(tag)
+
+	has_key = __contains__
+
+	def __iter__(self):
+		return iter(self.keys())
+
+
+	def copy(self):
+		"""Return an ordinary dictionary with all the field definitions in it."""
+
+		return dict(self.iteritems())
+
+
+# ----------------------------------------------------------------------
+class DDR(Record):
+	"""An ISO 8211 DDR (data definition record).
+
+	This is a sub-class of the DR class, `Record'.
+
+	Initialisation arguments:
+
+		ddf		the DDF we are in
+		reading		are we reading, rather than writing
+				(defaults to TRUE)
+
+	A DDR object contains (as well as its Record data):
+
+		dict			a dictionary of {field tag :: field definition}
+					derived from the DDR (a Field_desc_dict, so each
+					field definition is only worked out when it is
+					first looked up)
+
+		list			a list of field tags, in the order they occur
+					in the DDR
+
+		parents			a dictionary of {field tag :: parent field tag}
+					derived from the information in field 0..0 (if present)
+		child_list		a list of the child tags, in the order they occur
+					witrhin field 0..0
+
+	"ancestors()" gives the chain of parents for a tag, which is what
+	"Record.tree()" uses to nest the fields in a record.
+
+	"schema_id()" gives a string identifying the DDR's contents, which is
+	what a Frozen_record uses to refer to it.
+	"""
+
+	__slots__ = ("parents","child_list","_ancestors","dict","list",
+		     "_schema_id","_interning")
+
+	def __init__(self,ddf,reading=TRUE):
+
+		# Perform the "record" initialisation
+		# - the DDR is the zeroth record, which starts at the start of the file
+
+		Record.__init__(self,ddf,0,0,reading)
+
+		# So far we know nothing about field tag pairs
+
+		self.parents    = {}
+		self.child_list = []
+		self._ancestors = None	# worked out from them when needed
+		self._schema_id = None	# and our identifier, likewise
+		self._interning = None	# see "DDF.intern_values()"
+
+		# The main thing special about a DDR is its fields - we keep a
+		# dictionary of field definitions, and a list of the tags in the
+		# order they occur.
+
+		self.dict = Field_desc_dict(self)
+		self.list = []
+
+		if reading:
+			self._populate_innards()
+
+
+	def ancestors(self,tag):
+		"""Return a tuple of the ancestors of TAG in the tree of field tag pairs.
+
+		The tuple starts with TAG's parent, then its parent's parent, and
+		so on - it is empty if TAG has no parent. The ancestors of all the
+		tags are worked out together the first time this is called.
+		"""
+
+		if self._ancestors == None:
+			self._ancestors = {}
+
+			for child in self.child_list:
+				chain  = []
+				parent = self.parents.get(child)
+
+				# (guard against a tree which loops back on itself)
+
+				while parent != None and parent != child and parent not in chain:
+					chain.append(parent)
+					parent = self.parents.get(parent)
+
+				self._ancestors[child] = tuple(chain)
+
+		return self._ancestors.get(tag,())
+
+
+	def schema_id(self):
+		"""Return a string identifying the contents of this DDR.
+
+		This is the MD5 digest (in hex) of the DDR's octets, so DDRs that
+		are the same in different files (or different runs) have the same
+		identifier.
+		"""
+
+		if self._schema_id == None:
+			hash = md5(self.leader.octets)
+
+			hash.update(self.directory._octets)
+			hash.update(self.field_area._octets)
+
+			self._schema_id = hash.hexdigest()
+
+		return self._schema_id
+
+
+	def _populate_innards(self):
+		"""Populate our innards from the data read elsewhere."""
+
+		# Populate the dictionary of field definitions, and the list of
+		# tags (ordered according to the order they came in) - unless we
+		# are checking everything strictly (in which case we want to hear
+		# about any problems now), the field definitions are only worked
+		# out when they are wanted
+
+		size    = self.leader.sizeof_field_tag
+		special = _special_tags(size)
+		strict  = (self.ddf.validate == "strict")
+
+		for field in self:
+			tag = field.tag
+
+			# Some tags are special
+
+			if special.has_key(tag):
+				desc_class = special[tag]
+
+				if desc_class == None:		# Any other 0..<digit>
+
+					print "Warning: tag `%s' is a RESERVED tag - it should not be used"%tag
+
+					# But be friendly and use it anyway
+
+					desc_class = Field_desc
+			else:
+				# Any normal field
+
+				desc_class = Field_desc
+
+			self.dict.add(tag,desc_class,field.data)
+			self.list.append(tag)
+
+			if strict:
+				self.dict[tag]
+
+		# The file control field (if any) gives us our field tag pairs,
+		# so we always want that one straight away
+
+		nought0 = nought_tag(size,0)
+
+		if self.dict.has_key(nought0):
+			self.dict[nought0]
+
+		# Since this is a DDR, we should then really check that:
+		# a) there is a 0..0 field
+		# b) if this is a version 0 file, there is a 0..1 field (it was compulsory)
+		# c) that there are no 0..4 through 0..8 fields (they're not used)
+		# d) any 0..x tags that are there occur first and in ascending order
+
+	def __repr__(self):
+		return "Data descriptive record"
+
+
+	def write_DFD(self,dfd,merge=TRUE):
+		"""Write out the appropriate DFD data for this DDF.
+
+		MERGE is TRUE if want to intertwine labels and formats when possible,
+		and FALSE if we never want to.
+		"""
+
+		self.leader.write_DFD(dfd)
+
+		dfd.write("\n")
+
+		for tag in self.list:
+			self.dict[tag].write_DFD(dfd,merge)
+
+
+	def show(self,with_leader=TRUE):
+		"""Print out the contents of this DDR."""
+
+		print "Data description record (record 0 at offset 0)"
+
+		if with_leader:
+			self.leader.show()
+
+		print "    Field tag dictionary:"
+
+		if len(self.list) == 0:
+			print "        Empty"
+		else:
+			for tag in self.list:
+				self.dict[tag].show()
+
+
+
+# ----------------------------------------------------------------------
+def _padded_results(name,read):
+	"""Return the results of READ for the file NAME, and for a padded copy.
+
+	READ is called with the DDF open, first on NAME and then on a copy of
+	it with circumflexes added to the end.
+	"""
+
+	import tempfile
+
+	input  = open(name,"rb")
+	octets = input.read()
+	input.close()
+
+	handle,padded = tempfile.mkstemp(".ddf")
+	os.write(handle,octets + CIRCUMFLEX*64)
+	os.close(handle)
+
+	try:
+		results = []
+
+		for filename in (name,padded):
+			ddf = DDF()
+			ddf.open(filename)
+
+			results.append(read(ddf))
+
+			ddf.close()
+	finally:
+		os.remove(padded)
+
+	return results
+
+
+def _scanned(ddf):
+	"""Return the index, position and field data of each record from "scan()"."""
+
+	result = []
+
+	for record in ddf.scan():
+		result.append((record.index,record.posn,
+			       [field.data for field in record]))
+
+	return result
+
+
+def test_scan_padding(name):
+	"""Check that "DDF.scan()" stops at circumflex padding.
+
+	NAME is an ISO 8211 file - a copy of it with circumflexes added to the
+	end should give the same records as the file itself.
+	"""
+
+	results = _padded_results(name,_scanned)
+
+	if results[0] != results[1]:
+		raise AssertionError,"Scanning %s gave %d records, padded %d"%\
+		      (name,len(results[0]),len(results[1]))
+
+	print "scan padding: OK (%d records)"%len(results[0])
+
+
+def test_R_padding(name):
+	"""Check that reading a file stops at the padding after an "R" record.
+
+	This checks "scan()", "visit()", "events()", "R_table()" and "as_table()".
+
+	NAME is an ISO 8211 file with an "R" record - the records after that
+	are just field areas, so the padding can't be told by a leader.
+	"""
+
+	names = ("scan()","visit()","events()","R_table()","as_table()")
+
+	def read(ddf):
+		table = ddf.R_table()
+
+		if table == None:
+			raise AssertionError,"%s has no R record"%name
+
+		visited = []
+		ddf.visit(on_record=visited.append,
+			  on_field=lambda tag,data: visited.append((tag,data)))
+
+		rows  = [table[which] for which in range(table.count)]
+		table = ddf.as_table(table.tags)
+
+		return (_scanned(ddf),visited,[event for event in ddf.events()],rows,
+			(table.indices.tolist(),table.others,
+			 [table[which] for which in range(table.count)]))
+
+	results = _padded_results(name,read)
+
+	for which in range(len(names)):
+		if results[0][which] != results[1][which]:
+			raise AssertionError,"%s of %s differs when padded"%\
+			      (names[which],name)
+
+	print "R padding: OK (%d records)"%len(results[0][0])
+
+
+def test_dead_record(name):
+	"""Check that using a directory whose record has gone raises iso8211_record_error.
+
+	NAME is an ISO 8211 file with at least one data record.
+	"""
+
+	ddf = DDF()
+	ddf.open(name)
+
+	directory = ddf.record(1).directory
+
+	ddf.rewind()			# so the DDF doesn't keep the record either
+
+	try:
+		directory.field(0)
+	except iso8211_record_error:
+		pass
+	else:
+		raise AssertionError,"Expected an iso8211_record_error"
+
+	ddf.close()
 
+	print "dead record: OK"
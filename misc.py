@@ -38,6 +38,7 @@ import sys
 import os
 import array
 import string
+import binascii
 import Dates
 
 import format
@@ -67,6 +68,10 @@ class iso8211_index_error(Exception):
 	"ISO 8211 index error"
 	pass
 
+class iso8211_record_error(iso8211_error):
+	"ISO 8211 record no longer exists"
+	pass
+
 iso8211_array_error	= "ISO 8211 fixed array error"
 iso8211_syntax_error	= "ISO 8211 syntax error"
 iso8211_unsupported	= "ISO 8211 unsupported feature"
@@ -85,7 +90,7 @@ Exceptions = (iso8211_error,iso8211_version_error,iso8211_mode_error,
 	      iso8211_array_error,iso8211_syntax_error,iso8211_unsupported,
 	      iso8211_format_error,iso8211_internal_error,iso8211_unexpected,
 	      iso8211_concat_error,iso8211_fcfmt_error,iso8211_noarray_error,
-	      iso8211_noformat_error)
+	      iso8211_noformat_error,iso8211_record_error)
 
 
 # ----------------------------------------------------------------------
@@ -333,6 +338,32 @@ def iso2022_charset(str,in_ddr=FALSE):
 		return "(not known to this software)"
 
 
+# The Python codecs for the character sets we know how to decode,
+# by truncated escape sequence
+
+_iso2022_codecs = {
+	"   " : "ascii",		# ISO/IEC 646 IRV
+	"-A " : "latin-1",		# ISO 8859 part 1
+	"%/@" : "utf-16-be",		# ISO/IEC 10646 UCS-2 level 1
+	"%/C" : "utf-16-be",		# ISO/IEC 10646 UCS-2 level 2
+	"%/E" : "utf-16-be",		# ISO/IEC 10646 UCS-2 level 3
+	"%/A" : "utf-32-be",		# ISO/IEC 10646 UCS-4 level 1
+	"%/D" : "utf-32-be",		# ISO/IEC 10646 UCS-4 level 2
+	"%/F" : "utf-32-be",		# ISO/IEC 10646 UCS-4 level 3
+}
+
+def iso2022_codec(str):
+	"""Given a truncated escape sequence for ISO 2022, return a Python codec name.
+
+	Returns None if STR is None, or is not a character set we know (this
+	includes the DDR RP 17-19 values " ! " and "HHH", which just say that
+	the fields have their own escapes). ISO/IEC 10646 data is taken to be
+	most significant octet first.
+	"""
+
+	return _iso2022_codecs.get(str)
+
+
 def pretty_hex(str):
 	"""Return a `pretty' hex representation of the bytes in STR.
 
@@ -470,6 +501,28 @@ def read_to_UT_or_end(octets):
 	return read_to_char_or_end(octets,UT)
 
 
+def read_to_wide_UT_or_end(octets,ut):
+	"""Read a string of multi-octet characters terminated by UT or end-of-string.
+
+	UT is the unit terminator as encoded in the character set (for instance,
+	"\x00\x1f" for UCS-2), and is only recognised if it starts on a character
+	boundary (so a character whose octets happen to include it is not split).
+	If there is no UT, any octets at the end that do not make up a whole
+	character (such as a single octet UT) are not part of the string.
+	"""
+
+	width = len(ut)
+	posn  = string.find(octets,ut,0)
+
+	while posn != -1 and posn % width != 0:
+		posn = string.find(octets,ut,posn+1)
+
+	if posn == -1:				# not ended by UT
+		posn = len(octets) - len(octets) % width
+
+	return octets[:posn]
+
+
 
 def read_to_UT_or_FT(octets):
 	"""Read a string terminated by either UT or FT.
@@ -542,7 +595,7 @@ def is_nought_tag(tag):
 
 
 # ----------------------------------------------------------------------
-def read_item(data,control):
+def read_item(data,control,ut=UT):
 	"""Read an item from the start of DATA, using the format CONTROL.
 
 	Returns a tuple containing the item read (as a string) and what is
@@ -550,6 +603,10 @@ def read_item(data,control):
 
 	DATA should *not* include the final FT (that should have been stripped off).
 
+	UT is the unit terminator that ends a delimited "A" item - this is only
+	different from the usual UT if the character subfields are in a
+	multi-octet character set (see "Field_desc.wide_UT()").
+
 	Raises IndexError if an attempt is made to read data from a zero
 	length data string.
 	"""
@@ -597,6 +654,14 @@ def read_item(data,control):
 
 			item,data = _read_B_item(data)
 
+		elif control.control == "A" and ut != UT:
+
+			# We have a "read until UT (or end of data)" item,
+			# in a multi-octet character set
+
+			item = read_to_wide_UT_or_end(data,ut)
+			data = data[len(item)+len(ut):]
+
 		else:
 			# We have a "read until UT (or end of data)" item
 
@@ -671,13 +736,16 @@ def _read_WB_item(data,size):
 	"""
 
 	# The size is from the format - a "B(size)" format
-	# So the "size" is in bits. At the moment, we don't have proper
-	# support, we can only handle octet multiples (so a width of 7
-	# will cause us to give up...)
+	# So the "size" is in bits. Octet multiples are returned as a string,
+	# as they always have been, but anything else is read as a bit field
+	# (returning an integer), and the data is then resumed at the next
+	# octet boundary
 
 	if size % 8 != 0:
-		raise ValueError,\
-		      "Unable to cope with bit strings of width %d (not a multiple of 8)"%size
+		bits = Bit_reader(data)
+		item = bits.read(size)
+
+		return (item,bits.remainder())
 	else:
 		size = size / 8
 
@@ -733,6 +801,250 @@ def _read_B_item(data):
 
 
 
+# ----------------------------------------------------------------------
+class Bit_reader:
+	"""A cursor for reading packed bit fields from a string.
+
+	Initialisation arguments:
+
+		data		the octets to read the bit fields from
+
+	A Bit_reader object contains:
+
+		data		the octets we are reading from
+		bit		the offset (in bits) of the next bit to read
+
+	Adjacent "B(size)" subfields are packed together without regard to
+	octet boundaries, most significant bit first [6.4.3.3 f)], and the
+	run as a whole is padded out to the end of its final octet. So:
+
+		bits   = Bit_reader(data)
+		first  = bits.read(3)
+		second = bits.read(5)
+		data   = bits.remainder()
+
+	reads two bit fields and leaves "data" as what follows them.
+	"""
+
+	def __init__(self,data):
+		self.data = data
+		self.bit  = 0
+
+
+	def __repr__(self):
+		return "Bit reader at bit %d of %d"%(self.bit,len(self.data)*8)
+
+
+	def read(self,width):
+		"""Read and return a WIDTH bit unsigned integer.
+
+		Raises IndexError if there are not enough bits left.
+		"""
+
+		start = self.bit
+		end   = start + width
+
+		if end > len(self.data) * 8:
+			raise IndexError,"End of data"
+
+		first = start / 8
+		last  = (end + 7) / 8
+		value = _octets_to_long(self.data[first:last])
+
+		self.bit = end
+
+		return int((value >> (last*8 - end)) & ((1L << width) - 1))
+
+
+	def read_run(self,widths):
+		"""Read a run of bit fields, one for each of the WIDTHS given.
+
+		This converts the octets for the whole run in one go, rather than
+		doing it once per bit field. Returns a list of integers.
+
+		Raises IndexError if there are not enough bits left.
+		"""
+
+		start = self.bit
+		end   = start
+		for width in widths:
+			end = end + width
+
+		if end > len(self.data) * 8:
+			raise IndexError,"End of data"
+
+		first = start / 8
+		last  = (end + 7) / 8
+		value = _octets_to_long(self.data[first:last])
+		shift = last*8 - start
+
+		values = []
+		for width in widths:
+			shift = shift - width
+			values.append(int((value >> shift) & ((1L << width) - 1)))
+
+		self.bit = end
+
+		return values
+
+
+	def read_many(self,width,count=None):
+		"""Read COUNT bit fields of the same WIDTH, using "unpack_bits()".
+
+		If COUNT is None, then as many as will fit in the remaining data
+		are read. Returns an array of integers.
+		"""
+
+		if count == None:
+			count = (len(self.data) * 8 - self.bit) / width
+
+		first  = self.bit / 8
+		offset = self.bit % 8
+		values = unpack_bits(self.data[first:],width,count,offset)
+
+		self.bit = self.bit + count * width
+
+		return values
+
+
+	def remainder(self):
+		"""Return the data after the current run (padded to an octet boundary)."""
+
+		return self.data[(self.bit + 7) / 8:]
+
+
+def _octets_to_long(octets):
+	"""Return the MSOF octets in OCTETS as a (long) integer."""
+
+	if len(octets) == 0:
+		return 0L
+	else:
+		return long(binascii.hexlify(octets),16)
+
+
+def _gcd(a,b):
+	"""Return the greatest common divisor of A and B."""
+
+	while b != 0:
+		a,b = b,a % b
+
+	return a
+
+
+# The number of bits in a C long (as used by an "l" array), less the sign bit
+
+_array_long_bits = array.array("l").itemsize * 8 - 1
+
+def unpack_bits(data,width,count=None,offset=0):
+	"""Unpack COUNT packed WIDTH bit unsigned integers from DATA.
+
+	OFFSET is the number of bits to skip at the start of DATA. If COUNT
+	is None, then as many values as will fit are unpacked.
+
+	This is the `bulk' version of "Bit_reader.read()", for runs of bit
+	fields of the same width (as in bit-packed raster data). The octets
+	are converted in groups that hold a whole number of values, so that
+	we never have to shift anything longer than a group.
+
+	Returns an array of integers (or a list, if the values might not fit
+	into a C long). Either way, the values come out as (short) integers,
+	just as from "Bit_reader.read()".
+	"""
+
+	# (worked out before any realignment, which pads the data out)
+
+	total = len(data) * 8 - offset
+
+	if count == None:
+		count = total / width
+
+	if count * width > total:
+		raise IndexError,"Not enough data for %d values of width %d"%(count,width)
+
+	if offset != 0:
+		# Realign the data so that the first value starts at bit 0
+
+		value = _octets_to_long(data) & ((1L << total) - 1)
+		value = value << ((8 - total % 8) % 8)
+		data  = binascii.unhexlify("%0*x"%(((total + 7) / 8) * 2,value))
+
+	group_bits   = width * 8 / _gcd(width,8)	# lowest common multiple
+	group_octets = group_bits / 8
+	mask         = (1L << width) - 1
+	shifts       = range(group_bits - width,-1,-width)
+
+	if width < _array_long_bits:
+		values = array.array("l")
+	else:
+		values = []
+
+	needed = ((count * width + group_bits - 1) / group_bits) * group_octets
+	octets = data[:needed]
+
+	if len(octets) < needed:
+		octets = octets + "\0" * (needed - len(octets))
+
+	for posn in range(0,needed,group_octets):
+		value = _octets_to_long(octets[posn:posn+group_octets])
+		values.extend([int((value >> shift) & mask) for shift in shifts])
+
+	del values[count:]
+
+	return values
+
+
+def is_bit_field(control):
+	"""Return TRUE if CONTROL is a "B(size)" control that is read as a bit field."""
+
+	return control.form == "W" and control.control == "B" and control.size % 8 != 0
+
+
+def read_packed_item(data,control,bits,ut=UT):
+	"""Read an item from the start of DATA, coping with packed bit fields.
+
+	This is "read_item()" for use when splitting a field, where adjacent
+	"B(size)" subfields may share octets. BITS is the Bit_reader for the
+	current run of bit fields (or None if we are not in one).
+
+	Returns a tuple containing the item read, what is left of DATA, and
+	the Bit_reader to pass back in for the next item. Bit fields are
+	returned as integers, everything else as for "read_item()" (which
+	is given UT).
+
+	Raises IndexError if an attempt is made to read past the end of the data.
+	"""
+
+	if control.form == "W" and control.control == "B" and \
+	   (bits != None or control.size % 8 != 0):
+
+		if bits == None:
+			if data == "":
+				raise IndexError,"End of data"
+
+			bits = Bit_reader(data)
+
+		item = bits.read(control.size)
+
+		# If we are back on an octet boundary, the run is over
+
+		if bits.bit % 8 == 0:
+			data = bits.remainder()
+			bits = None
+
+		return (item,data,bits)
+
+	# Anything else ends any run of bit fields we were in
+
+	if bits != None:
+		data = bits.remainder()
+		bits = None
+
+	item,data = read_item(data,control,ut)
+
+	return (item,data,bits)
+
+
+
 def parse_item_with_control(control,item):
 	"""Given an ITEM (a string), parse it according to CONTROL.
 
@@ -813,6 +1125,11 @@ def parse_binary_item(datatype,item):
 	problems
 	"""
 
+	# Bit fields have already been read as integers
+
+	if isinstance(item,(int,long)):
+		return item
+
 	# Work out what datatype we have, exactly
 
 	if len(datatype) == 1:
@@ -977,6 +1294,58 @@ def read_and_parse_item(data,control):
 
 	return parse_item_with_control(control,item),data
 
+
+
+# ----------------------------------------------------------------------
+class Intern_table:
+	"""A table of values, used so that equal values can share one object.
+
+	Initialisation arguments:
+
+		size		the most values the table will hold
+
+	An Intern_table object contains:
+
+		size		as above
+		values		a dictionary of {value :: value}
+
+	"intern(value)" returns the value already in the table that is equal
+	to VALUE, if there is one - otherwise, VALUE is added to the table
+	(unless it is full) and returned. So:
+
+		table = Intern_table(1000)
+		a = table.intern(data[0:4])
+		b = table.intern(data[4:8])
+
+	gives "a is b" if the two slices were equal. Once the table is full,
+	new values are just returned as they are, so a field which turns out
+	to have many different values doesn't use up memory without limit.
+	"""
+
+	def __init__(self,size):
+		self.size   = size
+		self.values = {}
+
+
+	def __repr__(self):
+		return "Intern table of %d (of %d) values"%(len(self.values),self.size)
+
+
+	def __len__(self):
+		return len(self.values)
+
+
+	def intern(self,value):
+		"""Return the value in the table equal to VALUE (adding it if need be)."""
+
+		try:
+			return self.values[value]
+		except KeyError:
+			if len(self.values) < self.size:
+				self.values[value] = value
+			return value
+
+
 
 # ----------------------------------------------------------------------
 # Friendlier error handling